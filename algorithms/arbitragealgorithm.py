@@ -1,5 +1,7 @@
 from datetime import timedelta, datetime
 import dateutil
+import pandas as pd
+from algorithms.streaming import ArbitrageStream
 from constants.constants import DECISIONS
 from models.algorithm import BaseAlgorithm
 from models.signal import Signal
@@ -15,11 +17,28 @@ class ArbitrageAlgorithm(WithConsole, BaseAlgorithm):
     buy_threshold: int = 8
     sell_threshold: int = -5
     bars_shift: int = 10
+    weight_window: str = '180s'
+    buy_filter: float = 1.5
+    sell_filter: float = -0.8
     _bars_min: int = 5
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.latest_dataframe = None
+        self._latest_dataframe = None
+        self._stream = ArbitrageStream(self)
+
+    @property
+    def latest_dataframe(self):
+        """
+        Weighted buy indicator of every bar over the cutaway, of the latest batch or stream signal
+        """
+        if self._latest_dataframe is None:
+            return self._stream.weighted_indicator()
+        return self._latest_dataframe
+
+    @latest_dataframe.setter
+    def latest_dataframe(self, value):
+        self._latest_dataframe = value
 
     def _data_ok(self, source_df, order_book):
         if len(order_book) < self._bars_min:
@@ -41,22 +60,60 @@ class ArbitrageAlgorithm(WithConsole, BaseAlgorithm):
         if current_datetime is None:
             current_datetime = datetime.utcnow().replace(tzinfo=dateutil.tz.tzutc())
 
-        src_df = None
-        ord_df = None
-        if preprocessor is None:
-            src_df = source_df.resample(self.step).mean().interpolate()
-            ord_df = order_book.resample(self.step).mean().interpolate()
-            if not self._data_ok(source_df, order_book):
-                return Signal(**{
-                    'buy': 0.0,
-                    'sell': 0.0,
-                    'buy_datetime': current_datetime,
-                    'sell_datetime': current_datetime,
-                    'decision': DECISIONS.NO_DATA
-                })
-        else:
+        if preprocessor is not None:
             src_df, ord_df = preprocessor(source_df, order_book)
+            return self._batch_signal(src_df, ord_df, current_datetime)
+
+        if not self._data_ok(source_df, order_book):
+            return self._no_data(current_datetime)
+        return self._stream_signal(source_df, order_book, current_datetime)
+
+    def on_events(self, source_df, order_book, current_datetime):
+        """
+        Returns signal after feeding only the rows that arrived since the previous call, used by backtests
+        :param source_df: new trades, may be empty
+        :param order_book: new order book snapshots, may be empty
+        :param current_datetime:
+        :return:
+        """
+        self._update_stream(source_df, order_book, current_datetime)
+        if len(self._stream.orderbook) < self._bars_min:
+            return self._no_data(current_datetime)
+        return self._stream_result(current_datetime)
+
+    def _stream_signal(self, source_df, order_book, current_datetime):
+        """
+        Updates indicators with rows not seen by previous calls, instead of recomputing the whole window
+        :param source_df:
+        :param order_book:
+        :param current_datetime:
+        :return:
+        """
+        self._update_stream(source_df, order_book, current_datetime)
+        print("[info] Calculated indicators")
+        return self._stream_result(current_datetime)
+
+    def _update_stream(self, source_df, order_book, current_datetime):
+        if self._stream.current_time is not None and current_datetime < self._stream.current_time:
+            # Replay started over
+            self._stream = ArbitrageStream(self)
+        self._latest_dataframe = None
+        self._stream.update(source_df, order_book, current_datetime)
 
+    def _stream_result(self, current_datetime):
+        indicators = self._stream.indicators()
+        if indicators is None:
+            return self._no_data(current_datetime)
+        indicator_datetime, buy, sell = indicators
+        return Signal(**{
+            'buy': round(buy, 2),
+            'sell': round(sell, 2),
+            'buy_datetime': indicator_datetime,
+            'sell_datetime': indicator_datetime,
+            'decision': self._decide(buy, sell)
+        })
+
+    def _batch_signal(self, src_df, ord_df, current_datetime):
         # Curvefitting of both charts
         shifted_target = ((ord_df['ask'] + ord_df['bid']) / 2).rolling(self.rolling_window).mean().shift(
             self.bars_shift)
@@ -75,23 +132,17 @@ class ArbitrageAlgorithm(WithConsole, BaseAlgorithm):
         arbitrage_difference = ((src_df['price'] * coeffs) - ord_df['ask'])
         # Get indicator
         arbitrage_indicator = (arbitrage_difference / normalized_ask_bid_distance).dropna()
-        # filter indicator for values more than 1.5
-        arbitrage_indicator.loc[arbitrage_indicator < 1.5] = 0
-        weighted_arbitrage_indicator = arbitrage_indicator.rolling('180s').sum()
+        # filter indicator for values more than buy_filter
+        arbitrage_indicator.loc[arbitrage_indicator < self.buy_filter] = 0
+        weighted_arbitrage_indicator = arbitrage_indicator.rolling(self.weight_window).sum()
         sell_difference = ((src_df['price'] * coeffs) - ord_df['bid'])
         sell_indicator = (sell_difference / normalized_ask_bid_distance).dropna()
-        sell_indicator.loc[sell_indicator > -0.8] = 0
-        weighted_sell_indicator = sell_indicator.rolling('180s').sum()
+        sell_indicator.loc[sell_indicator > self.sell_filter] = 0
+        weighted_sell_indicator = sell_indicator.rolling(self.weight_window).sum()
         self.latest_dataframe = weighted_arbitrage_indicator
         print("[info] Calculated indicators")
         if len(weighted_arbitrage_indicator) == 0 or len(weighted_sell_indicator) == 0:
-            return Signal(**{
-                'buy': 0.0,
-                'sell': 0.0,
-                'buy_datetime': current_datetime,
-                'sell_datetime': current_datetime,
-                'decision': DECISIONS.NO_DATA
-            })
+            return self._no_data(current_datetime)
         return Signal(**{
             'buy': round(weighted_arbitrage_indicator.iloc[-1], 2),
             'sell': round(weighted_sell_indicator.iloc[-1], 2),
@@ -103,6 +154,15 @@ class ArbitrageAlgorithm(WithConsole, BaseAlgorithm):
             )
         })
 
+    def _no_data(self, current_datetime):
+        return Signal(**{
+            'buy': 0.0,
+            'sell': 0.0,
+            'buy_datetime': current_datetime,
+            'sell_datetime': current_datetime,
+            'decision': DECISIONS.NO_DATA
+        })
+
     def _decide(self, buy, sell):
         result = DECISIONS.AMBIGUOUS
         if buy > self.buy_threshold:
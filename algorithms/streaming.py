@@ -0,0 +1,323 @@
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+class BarSeries:
+    """
+    Incrementally maintained equivalent of `df[fields].resample(step).mean().interpolate()` over the points
+    not older than the cutoff. Points are added and evicted one at a time, and the sum of all bar values,
+    interpolated bars included, is kept up to date so window means cost O(1) per tick.
+    """
+
+    def __init__(self, fields, step):
+        self.fields = fields
+        self.step = step
+        self.latest = None
+        self.version = 0
+        self._points = {}
+        self._order = deque()
+        self._bars = {}
+        self._bar_order = deque()
+        self._totals = [0.0] * len(fields)
+
+    def __len__(self):
+        return len(self._points)
+
+    @property
+    def empty(self):
+        return len(self._bar_order) == 0
+
+    @property
+    def first(self):
+        return self._bar_order[0]
+
+    @property
+    def last(self):
+        return self._bar_order[-1]
+
+    def add(self, timestamp, values):
+        """
+        Adds a point, or replaces the one previously added with the same timestamp
+        :param timestamp: UNIX timestamp
+        :param values: sequence of floats matching `fields`
+        :return:
+        """
+        values = tuple(float(x) for x in values)
+        self.version += 1
+        bar = int(timestamp // self.step)
+        if timestamp in self._points:
+            self._change(bar, self._points[timestamp], -1)
+        elif bar in self._bars:
+            self._order.append(timestamp)
+        else:
+            self._order.append(timestamp)
+            self._new_bar(bar)
+        self._points[timestamp] = values
+        self._change(bar, values, 1)
+        if self.latest is None or timestamp > self.latest:
+            self.latest = timestamp
+
+    def evict(self, cutoff):
+        """
+        Removes points older than `cutoff` UNIX timestamp
+        :param cutoff:
+        :return:
+        """
+        while self._order and self._order[0] < cutoff:
+            timestamp = self._order.popleft()
+            values = self._points.pop(timestamp)
+            self.version += 1
+            bar = int(timestamp // self.step)
+            if self._bars[bar][1] > 1:
+                self._change(bar, values, -1)
+            else:
+                self._drop_bar(bar)
+        if not self._points:
+            self.latest = None
+
+    def value(self, bar, field=0):
+        """
+        Returns mean of the bar, interpolated between neighbouring bars if the bar has no points
+        :param bar:
+        :param field:
+        :return:
+        """
+        if bar in self._bars:
+            return self._mean(bar, field)
+        left = right = None
+        for candidate in reversed(self._bar_order):
+            if candidate < bar:
+                left = candidate
+                break
+            right = candidate
+        left_value = self._mean(left, field)
+        right_value = self._mean(right, field)
+        return left_value + (right_value - left_value) * (bar - left) / (right - left)
+
+    def window_mean(self, bar, field, bars):
+        """
+        Returns mean of bar values in the `bars` long window ending at `bar`, clipped to the first bar
+        :param bar:
+        :param field:
+        :param bars:
+        :return:
+        """
+        start = max(self.first, bar - bars + 1)
+        total = self._totals[field]
+        for excluded in range(bar + 1, self.last + 1):
+            total -= self.value(excluded, field)
+        for excluded in range(self.first, start):
+            total -= self.value(excluded, field)
+        return total / (bar - start + 1)
+
+    def _mean(self, bar, field):
+        sums, count = self._bars[bar]
+        return sums[field] / count
+
+    def _weight(self, position):
+        """
+        Returns how many grid bars the data bar at `position` contributes to: itself and half of both adjacent gaps
+        """
+        weight = 1.0
+        if position > 0:
+            weight += (self._bar_order[position] - self._bar_order[position - 1] - 1) / 2
+        if position < len(self._bar_order) - 1:
+            weight += (self._bar_order[position + 1] - self._bar_order[position] - 1) / 2
+        return weight
+
+    def _change(self, bar, values, sign):
+        sums, count = self._bars[bar]
+        if count > 0:
+            before = [x / count for x in sums]
+        else:
+            before = [0.0] * len(sums)
+        count += sign
+        sums = [x + sign * y for x, y in zip(sums, values)]
+        self._bars[bar] = [sums, count]
+        if count > 0:
+            after = [x / count for x in sums]
+        else:
+            after = [0.0] * len(sums)
+        weight = self._weight(self._position(bar))
+        self._totals = [t + (a - b) * weight for t, a, b in zip(self._totals, after, before)]
+
+    def _position(self, bar):
+        if bar == self._bar_order[-1]:
+            return len(self._bar_order) - 1
+        if bar == self._bar_order[0]:
+            return 0
+        return self._bar_order.index(bar)
+
+    def _new_bar(self, bar):
+        if self._bar_order and bar < self._bar_order[-1]:
+            # Out of order point, rebuild the grid around it
+            self._bars[bar] = [[0.0] * len(self.fields), 0]
+            self._bar_order = deque(sorted(list(self._bar_order) + [bar]))
+            self._recompute_totals()
+            return
+        if self._bar_order:
+            # The previous last bar now also covers half of the gap before the new bar
+            gap = bar - self._bar_order[-1] - 1
+            previous = self._bar_order[-1]
+            self._totals = [t + self._mean(previous, i) * gap / 2 for i, t in enumerate(self._totals)]
+        self._bars[bar] = [[0.0] * len(self.fields), 0]
+        self._bar_order.append(bar)
+
+    def _drop_bar(self, bar):
+        if bar != self._bar_order[0]:
+            del self._bars[bar]
+            self._bar_order.remove(bar)
+            self._recompute_totals()
+            return
+        weight = self._weight(0)
+        self._totals = [t - self._mean(bar, i) * weight for i, t in enumerate(self._totals)]
+        if len(self._bar_order) > 1:
+            following = self._bar_order[1]
+            gap = following - bar - 1
+            self._totals = [t - self._mean(following, i) * gap / 2 for i, t in enumerate(self._totals)]
+        del self._bars[bar]
+        self._bar_order.popleft()
+        if not self._bar_order:
+            self._totals = [0.0] * len(self.fields)
+
+    def _recompute_totals(self):
+        totals = [0.0] * len(self.fields)
+        for position, bar in enumerate(self._bar_order):
+            sums, count = self._bars[bar]
+            if count == 0:
+                continue
+            weight = self._weight(position)
+            totals = [t + x / count * weight for t, x in zip(totals, sums)]
+        self._totals = totals
+
+
+class ArbitrageStream:
+    """
+    Keeps ArbitrageAlgorithm indicators up to date from new trades and order book snapshots only.
+    Produces the last values of the weighted buy and sell indicators the batch computation would produce,
+    and on demand its whole weighted buy indicator series.
+    """
+
+    def __init__(self, algorithm):
+        self._algorithm = algorithm
+        self._step = int(pd.Timedelta(algorithm.step).total_seconds())
+        self.source = BarSeries(['price'], self._step)
+        self.orderbook = BarSeries(['ask', 'bid'], self._step)
+        self.current_time = None
+        self._computed = (None, None)
+        self._series = (None, None)
+
+    def update(self, source_df, order_book, current_time):
+        """
+        Feeds rows of the dataframes not seen yet and evicts points older than algorithm cutaway
+        :param source_df: trades dataframe with 'timestamp' and 'price' columns
+        :param order_book: order book dataframe with 'timestamp', 'ask' and 'bid' columns
+        :param current_time: datetime
+        :return:
+        """
+        self.current_time = current_time
+        for series, df in ((self.source, source_df), (self.orderbook, order_book)):
+            for timestamp, values in self._new_rows(series, df):
+                series.add(timestamp, values)
+        cutoff = current_time.timestamp() - self._algorithm.cutaway.total_seconds()
+        self.source.evict(cutoff)
+        self.orderbook.evict(cutoff)
+
+    def indicators(self):
+        """
+        Returns (bar time, weighted buy indicator, weighted sell indicator) of the latest bar, or None
+        :return:
+        """
+        versions = (self.source.version, self.orderbook.version)
+        if self._computed[0] == versions:
+            return self._computed[1]
+        result = self._indicators()
+        self._computed = (versions, result)
+        return result
+
+    def weighted_indicator(self):
+        """
+        Returns the weighted buy indicator of every bar of the window as a Series, like the batch computation,
+        or None. Costs O(window) bars, so it is meant for displays and not for every tick.
+        :return:
+        """
+        versions = (self.source.version, self.orderbook.version)
+        if self._series[0] == versions:
+            return self._series[1]
+        result = None
+        bounds = self._bounds()
+        if bounds is not None:
+            lower, last, window, weight_window = bounds
+            buys = [self._bar_indicators(bar, window)[0] for bar in range(lower, last + 1)]
+            weighted = [sum(buys[max(0, x - weight_window + 1):x + 1]) for x in range(len(buys))]
+            result = pd.Series(weighted, index=[self._bar_time(bar) for bar in range(lower, last + 1)])
+        self._series = (versions, result)
+        return result
+
+    def _bounds(self):
+        """
+        Returns (first bar, last bar, rolling window bars, weight window bars) of the indicators, or None
+        """
+        if self.source.empty or self.orderbook.empty:
+            return None
+        algorithm = self._algorithm
+        step = pd.Timedelta(algorithm.step)
+        window = int(pd.Timedelta(algorithm.rolling_window) / step)
+        weight_window = int(pd.Timedelta(algorithm.weight_window) / step)
+        lower = max(self.source.first, self.orderbook.first) + algorithm.bars_shift
+        last = min(self.source.last, self.orderbook.last)
+        if last < lower:
+            return None
+        return lower, last, window, weight_window
+
+    def _indicators(self):
+        bounds = self._bounds()
+        if bounds is None:
+            return None
+        lower, last, window, weight_window = bounds
+        buy = 0.0
+        sell = 0.0
+        for bar in range(max(lower, last - weight_window + 1), last + 1):
+            bar_buy, bar_sell = self._bar_indicators(bar, window)
+            buy += bar_buy
+            sell += bar_sell
+        return self._bar_time(last), buy, sell
+
+    def _bar_time(self, bar):
+        # Bars are UNIX time, stamped in the zone of the tick time like the no data signals of the same history
+        bar_time = pd.Timestamp(bar * self._step, unit='s', tz='UTC')
+        if getattr(self.current_time, 'tzinfo', None) is None:
+            return bar_time.tz_localize(None)
+        return bar_time.tz_convert(self.current_time.tzinfo)
+
+    def _bar_indicators(self, bar, window):
+        algorithm = self._algorithm
+        reference = bar - algorithm.bars_shift
+        shifted_target = (self.orderbook.window_mean(reference, 0, window)
+                          + self.orderbook.window_mean(reference, 1, window)) / 2
+        shifted_source = self.source.window_mean(reference, 0, window)
+        price = self.source.value(bar) * shifted_target / shifted_source
+        ask = self.orderbook.value(bar, 0)
+        bid = self.orderbook.value(bar, 1)
+        distance = max(ask - bid, bid * algorithm.min_ask_bid_ratio)
+        if distance <= 0:
+            return 0.0, 0.0
+        buy = (price - ask) / distance
+        sell = (price - bid) / distance
+        return (buy if buy >= algorithm.buy_filter else 0.0), (sell if sell <= algorithm.sell_filter else 0.0)
+
+    def _new_rows(self, series, df):
+        if df is None or len(df) == 0:
+            return []
+        timestamps = df['timestamp'].values
+        position = 0
+        if series.latest is not None:
+            position = np.searchsorted(timestamps, series.latest, side='left')
+        timestamps = timestamps[position:].astype(np.float64)
+        if len(timestamps) == 0:
+            return []
+        values = np.column_stack([df[field].values[position:].astype(np.float64) for field in series.fields])
+        valid = ~(np.isnan(timestamps) | np.isnan(values).any(axis=1))
+        return zip(timestamps[valid], values[valid])
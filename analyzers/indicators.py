@@ -0,0 +1,177 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def to_bars(window, step):
+    """
+    Returns number of `step` bars in a time window, e.g. 120 for '2h' of '1T' bars
+    :param window: pandas offset string
+    :param step: pandas offset string
+    :return:
+    """
+    return int(pd.Timedelta(window) / pd.Timedelta(step))
+
+
+def align_bars(src_df, ord_df):
+    """
+    Returns a frame of source price, ask and bid on the union of the resampled source and order book bars
+    :param src_df: resampled source dataframe
+    :param ord_df: resampled order book dataframe
+    :return:
+    """
+    return pd.concat([src_df['price'], ord_df['ask'], ord_df['bid']], axis=1)
+
+
+def calculate_indicators(price, ask, bid, window_bars, bars_shift, min_ask_bid_ratio, weight_bars=3,
+                         buy_filter=1.5, sell_filter=-0.8):
+    """
+    Returns weighted buy and sell arbitrage indicators for arrays on a common regular bar grid
+    :param price: source price bars
+    :param ask: target ask bars
+    :param bid: target bid bars
+    :param window_bars: bars in the rolling window used for curvefitting
+    :param bars_shift: bars the curvefitting coefficients lag behind
+    :param min_ask_bid_ratio: minimum ask/bid distance relative to bid, hedging against commission
+    :param weight_bars: bars summed into the weighted indicators
+    :param buy_filter: buy indicator values below it are zeroed
+    :param sell_filter: sell indicator values above it are zeroed
+    :return: (weighted buy, weighted sell) arrays
+    """
+    price = pd.Series(price)
+    ask = pd.Series(ask)
+    bid = pd.Series(bid)
+    shifted_target = ((ask + bid) / 2).rolling(window_bars, min_periods=1).mean().shift(bars_shift)
+    shifted_source = price.rolling(window_bars, min_periods=1).mean().shift(bars_shift)
+    fitted_price = price * (shifted_target / shifted_source)
+    distance = np.maximum(ask - bid, bid * min_ask_bid_ratio)
+
+    buy = (fitted_price - ask) / distance
+    buy[buy < buy_filter] = 0
+    sell = (fitted_price - bid) / distance
+    sell[sell > sell_filter] = 0
+    return (
+        buy.rolling(weight_bars, min_periods=1).sum().values,
+        sell.rolling(weight_bars, min_periods=1).sum().values
+    )
+
+
+def data_key(index, *arrays):
+    """
+    Returns a key identifying bar data by its time range, length and a hash of the bar times and values
+    :param index: bar times
+    :param arrays: bar value arrays
+    :return:
+    """
+    if len(index) == 0:
+        return 0,
+    index = pd.DatetimeIndex(index)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(np.ascontiguousarray(index.values.astype('datetime64[ns]').view(np.int64)).tobytes())
+    for values in arrays:
+        digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return len(index), index[0], index[-1], digest.hexdigest()
+
+
+class IndicatorCache:
+    """
+    LRU cache of weighted indicators keyed by data and indicator parameters.
+    Threshold combinations sharing the indicator parameters reuse one computation.
+    """
+
+    def __init__(self, size=8):
+        self._size = size
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, index, price, ask, bid, key=None, **parameters):
+        """
+        Returns (weighted buy, weighted sell) arrays, see calculate_indicators
+        :param index: bar times
+        :param price: source price bars
+        :param ask: target ask bars
+        :param bid: target bid bars
+        :param key: precomputed data_key of the bars
+        :param parameters: calculate_indicators keyword arguments
+        :return:
+        """
+        if key is None:
+            key = data_key(index, price, ask, bid)
+        key = (key, tuple(sorted(parameters.items())))
+        if key in self._items:
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+        self.misses += 1
+        result = calculate_indicators(price, ask, bid, **parameters)
+        for array in result:
+            array.flags.writeable = False
+        self._items[key] = result
+        if len(self._items) > self._size:
+            self._items.popitem(last=False)
+        return result
+
+    def clear(self):
+        self._items.clear()
+
+
+INDICATOR_CACHE = IndicatorCache()
+
+
+def crossings(indicator, threshold, upwards=True):
+    """
+    Returns boolean array of bars where the indicator crosses the threshold
+    :param indicator:
+    :param threshold:
+    :param upwards: crossing from at or below to above if True, from at or above to below otherwise
+    :return:
+    """
+    result = np.zeros(len(indicator), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        if upwards:
+            result[1:] = (indicator[1:] > threshold) & (indicator[:-1] <= threshold)
+        else:
+            result[1:] = (indicator[1:] < threshold) & (indicator[:-1] >= threshold)
+    return result
+
+
+def extract_deals(index, buy, sell, ask, bid, commission=0.005):
+    """
+    Returns deals opened on a buy crossing at ask and closed on the next sell crossing at bid.
+    A deal can be closed on the bar it was opened at, a new deal opens strictly after the previous close.
+    :param index: bar times
+    :param buy: boolean array of buy crossings
+    :param sell: boolean array of sell crossings
+    :param ask: array of ask prices
+    :param bid: array of bid prices
+    :param commission: commission charged on the buy price
+    :return: list of deal dicts
+    """
+    buy_positions = np.flatnonzero(buy)
+    sell_positions = np.flatnonzero(sell)
+    deals = []
+    position = 0
+    while True:
+        next_buy = np.searchsorted(buy_positions, position)
+        if next_buy == len(buy_positions):
+            break
+        opened = buy_positions[next_buy]
+        next_sell = np.searchsorted(sell_positions, opened)
+        if next_sell == len(sell_positions):
+            break
+        closed = sell_positions[next_sell]
+        buyprice = ask[opened]
+        sellprice = bid[closed]
+        deals.append({
+            'status': True,
+            'buytime': index[opened],
+            'selltime': index[closed],
+            'buyprice': buyprice,
+            'sellprice': sellprice,
+            'profit': (sellprice - buyprice - buyprice * commission) / buyprice * 100
+        })
+        position = closed + 1
+    return deals
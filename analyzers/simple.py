@@ -4,6 +4,9 @@ from bokeh.palettes import Spectral10, Category10
 import pandas as pd
 
 
+from algorithms.arbitragealgorithm import ArbitrageAlgorithm
+from analyzers.indicators import INDICATOR_CACHE, align_bars, data_key, to_bars
+from analyzers.sweep import ParameterSweep
 from objects.dataframes import create_empty_dataframe
 from constants.constants import INDICATOR_NAMES as NAMES
 from utils.timing import user_input_to_utc_time
@@ -22,6 +25,8 @@ class BaseArbitrageAnalyzer:
         self._end = end
         self._console = console
         self._min_ask_bid_ratio = 0.0035
+        self._buy_thresholds = [8, 10]
+        self._sell_thresholds = [-5, -3]
 
     def analyze(self):
         """
@@ -38,44 +43,52 @@ class BaseArbitrageAnalyzer:
         self._console.text += "[info] Loaded data\n"
         src_df = src_df.truncate(before=start_date, after=end_date).resample('1T').mean().interpolate()
         ord_df = ord_df.truncate(before=start_date, after=end_date).resample('1T').mean().interpolate()
-        coeffs = ((ord_df['ask'] + ord_df['bid']) / 2).rolling('2h').mean().shift(10) / src_df['price'].rolling('2h').mean().shift(10)
-        normalized_ask_bid_distance = ord_df['ask'] - ord_df['bid']
-        minimum_ask_bid_distance = ord_df['bid'] * self._min_ask_bid_ratio
+        bars = align_bars(src_df, ord_df)
         self._console.text += "[info] Calculated index\n"
-        normalized_ask_bid_distance.loc[normalized_ask_bid_distance < minimum_ask_bid_distance] = minimum_ask_bid_distance
-        arbitrage_difference = ((src_df['price'] * coeffs) - ord_df['ask'])
-        # Get indicator
-        arbitrage_indicator = arbitrage_difference / normalized_ask_bid_distance
-        # filter indicator for values more than 1.5
-        arbitrage_indicator.loc[arbitrage_indicator < 1.5] = 0
-        weighted_arbitrage_indicator = arbitrage_indicator.rolling('180s').sum()
-        sell_difference = ((src_df['price'] * coeffs) - ord_df['bid'])
-        sell_indicator = sell_difference / normalized_ask_bid_distance
-        sell_indicator.loc[sell_indicator > -0.8] = 0
-        weighted_sell_indicator = sell_indicator.rolling('180s').sum()
+        parameters = dict(
+            window_bars=to_bars(ArbitrageAlgorithm.rolling_window, ArbitrageAlgorithm.step),
+            bars_shift=ArbitrageAlgorithm.bars_shift,
+            min_ask_bid_ratio=self._min_ask_bid_ratio,
+            buy_filter=ArbitrageAlgorithm.buy_filter,
+            sell_filter=ArbitrageAlgorithm.sell_filter
+        )
+        key = data_key(bars.index, bars['price'].values, bars['ask'].values, bars['bid'].values)
+        weighted_buy, weighted_sell = INDICATOR_CACHE.get(
+            bars.index, bars['price'].values, bars['ask'].values, bars['bid'].values, key=key,
+            weight_bars=to_bars(ArbitrageAlgorithm.weight_window, ArbitrageAlgorithm.step),
+            **parameters
+        )
+        # Summing over a single bar leaves the filtered, unweighted buy indicator
+        buy, _ = INDICATOR_CACHE.get(
+            bars.index, bars['price'].values, bars['ask'].values, bars['bid'].values, key=key, weight_bars=1,
+            **parameters
+        )
+        arbitrage_indicator = pd.Series(buy, index=bars.index)
+        weighted_arbitrage_indicator = pd.Series(weighted_buy, index=bars.index)
+        weighted_sell_indicator = pd.Series(weighted_sell, index=bars.index)
         self._console.text += "[info] Calculated indicators\n"
         self._line(NAMES.SIMPLE, weighted_arbitrage_indicator, color=Category10[10][3])
         self._line(NAMES.WEIGTHED, weighted_sell_indicator, color=Category10[10][4])
 
-        buy_thresholds = [8, 10]
-        sell_thresholds = [-5, -3]
-
         self._console.text += "[info] Performing optimizations...\n"
-        for buy_threshold in buy_thresholds:
-            for sell_threshold in sell_thresholds:
-                deals = self._calculate_profit(buy_threshold, sell_threshold, weighted_arbitrage_indicator, weighted_sell_indicator, ord_df)
-                mean_profit = 0
-                for deal in deals:
-                    self._draw_deal(deal)
-                    mean_profit += deal['profit']
-                if len(deals) > 0:
-                    self._console.text += "Buy @ {} Sell @ {}\nMean profit: {}@{}.\nTotal: {}\n".format(
-                        buy_threshold,
-                        sell_threshold,
-                        mean_profit / len(deals),
-                        len(deals),
-                        mean_profit
-                    )
+        # Keep the sweep in the server process, the grid is small
+        sweep = ParameterSweep(src_df, ord_df, processes=1)
+        results = sweep.run(dict(
+            buy_threshold=self._buy_thresholds,
+            sell_threshold=self._sell_thresholds,
+            min_ask_bid_ratio=[self._min_ask_bid_ratio]
+        ), keep_deals=True)
+        for _, row in results.iterrows():
+            for deal in row['deals']:
+                self._draw_deal(deal)
+            if row['trades'] > 0:
+                self._console.text += "Buy @ {} Sell @ {}\nMean profit: {}@{}.\nTotal: {}\n".format(
+                    row['buy_threshold'],
+                    row['sell_threshold'],
+                    row['mean_profit'],
+                    row['trades'],
+                    row['profit']
+                )
 
         self._console.text += "[info] Done.\n"
 
@@ -92,45 +105,6 @@ class BaseArbitrageAnalyzer:
 
         return arbitrage_indicator, src_df, ord_df
 
-    def _calculate_profit(self, buy_threshold, sell_threshold, weighted_arbitrage_indicator, weighted_sell_indicator, ord_df):
-        buy_condition = (weighted_arbitrage_indicator > buy_threshold) & (weighted_arbitrage_indicator.shift(1) <= buy_threshold)
-        sell_condition = (weighted_sell_indicator < sell_threshold) & (weighted_sell_indicator.shift(1) >= sell_threshold)
-
-        buy_condition.name = "buy"
-        sell_condition.name = "sell"
-        combined = pd.concat([ord_df, buy_condition, sell_condition], axis=1)
-        deals = []
-        new_deal = {
-            'status': None,
-            'buytime': None,
-            'selltime': None,
-            'buyprice': None,
-            'sellprice': None,
-            'profit': 0.0
-        }
-        current_deal = {}
-        current_deal.update(new_deal)
-        for idx, row in combined.iterrows():
-            buy = row.buy
-            sell = row.sell
-            if buy and current_deal['status'] is None:
-                # Open the deal
-                current_deal['status'] = True
-                current_deal['buytime'] = idx
-                current_deal['buyprice'] = row.ask
-            if sell and current_deal['status'] is not None:
-                # Close the deal and wipe current
-                current_deal['selltime'] = idx
-                current_deal['sellprice'] = row.bid
-                current_deal['profit'] = (current_deal['sellprice'] - current_deal['buyprice'] - current_deal['buyprice'] * 0.005) / current_deal['buyprice'] * 100
-                # self._console.text += str(current_deal['profit']) + "%\n"
-                deals.append(current_deal)
-                current_deal = {}
-                current_deal.update(new_deal)
-
-        return deals
-
-
     def _draw_deal(self, deal):
         self._plot.line([deal['buytime'], deal['selltime']], [deal['buyprice'], deal['sellprice']], line_width=4, color='red', alpha=0.5)
 
@@ -0,0 +1,124 @@
+import itertools
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+import pandas as pd
+
+from algorithms.arbitragealgorithm import ArbitrageAlgorithm
+from analyzers.indicators import INDICATOR_CACHE, align_bars, crossings, data_key, extract_deals, to_bars
+
+# Arrays shared with the worker process, set once per worker by _init_worker
+_SHARED = {}
+
+
+def _init_worker(arrays, count):
+    _SHARED.clear()
+    _SHARED.update({name: np.frombuffer(array, dtype=np.float64, count=count) for name, array in arrays.items()
+                    if name != 'index'})
+    _SHARED['index'] = pd.to_datetime(np.frombuffer(arrays['index'], dtype=np.int64, count=count))
+    _SHARED['key'] = data_key(_SHARED['index'], _SHARED['price'], _SHARED['ask'], _SHARED['bid'])
+
+
+def _evaluate(point, keep_deals=False):
+    price, ask, bid = _SHARED['price'], _SHARED['ask'], _SHARED['bid']
+    weighted_buy, weighted_sell = INDICATOR_CACHE.get(
+        _SHARED['index'], price, ask, bid,
+        key=_SHARED['key'],
+        window_bars=to_bars(point['rolling_window'], point['step']),
+        bars_shift=point['bars_shift'],
+        min_ask_bid_ratio=point['min_ask_bid_ratio'],
+        weight_bars=to_bars(point['weight_window'], point['step']),
+        buy_filter=point['buy_filter'],
+        sell_filter=point['sell_filter']
+    )
+    deals = extract_deals(
+        _SHARED['index'],
+        crossings(weighted_buy, point['buy_threshold']),
+        crossings(weighted_sell, point['sell_threshold'], upwards=False),
+        ask,
+        bid
+    )
+    profits = np.array([deal['profit'] for deal in deals], dtype=np.float64)
+    equity = np.concatenate([[0.0], np.cumsum(profits)])
+    result = {name: point[name] for name in ParameterSweep.parameters}
+    result.update(
+        profit=equity[-1],
+        trades=len(deals),
+        mean_profit=profits.mean() if len(deals) > 0 else 0.0,
+        drawdown=(np.maximum.accumulate(equity) - equity).max()
+    )
+    if keep_deals:
+        result['deals'] = deals
+    return result
+
+
+class ParameterSweep:
+    """
+    Evaluates ArbitrageAlgorithm parameter combinations over the same resampled data in a process pool.
+    The source and order book bars are placed in shared memory once and read by every worker without copying.
+    """
+    parameters = ('buy_threshold', 'sell_threshold', 'rolling_window', 'bars_shift', 'min_ask_bid_ratio')
+    fixed_parameters = ('step', 'weight_window', 'buy_filter', 'sell_filter')
+
+    def __init__(self, src_df, ord_df, algorithm=ArbitrageAlgorithm, processes=None):
+        """
+        :param src_df: source dataframe resampled to algorithm step bars
+        :param ord_df: order book dataframe resampled to algorithm step bars
+        :param algorithm: algorithm class or instance supplying default parameters
+        :param processes: number of worker processes, all cores by default, 1 evaluates in this process
+        """
+        if processes is None:
+            processes = cpu_count()
+        self._algorithm = algorithm
+        self._processes = processes
+        bars = align_bars(src_df, ord_df)
+        self._count = len(bars)
+        self._arrays = {
+            'price': self._share(bars['price'].values, 'd'),
+            'ask': self._share(bars['ask'].values, 'd'),
+            'bid': self._share(bars['bid'].values, 'd'),
+            'index': self._share(bars.index.values.astype('datetime64[ns]').astype(np.int64), 'q'),
+        }
+
+    def run(self, grid=None, keep_deals=False):
+        """
+        Returns results table ranked by total profit
+        :param grid: {parameter: list of values}, parameters absent from it keep algorithm values
+        :param keep_deals: add a column with the deals of every combination
+        :return: DataFrame with parameter, profit, trades, mean_profit and drawdown columns
+        """
+        points = self._points(grid)
+        evaluate = partial(_evaluate, keep_deals=keep_deals)
+        if self._processes == 1 or len(points) < 2:
+            _init_worker(self._arrays, self._count)
+            results = [evaluate(point) for point in points]
+        else:
+            thresholds = len(points) // len(set(self._indicator_parameters(point) for point in points))
+            chunksize = max(thresholds, len(points) // (self._processes * 4))
+            with Pool(self._processes, initializer=_init_worker, initargs=(self._arrays, self._count)) as pool:
+                results = pool.map(evaluate, points, chunksize=chunksize)
+        table = pd.DataFrame.from_records(results)
+        return table.sort_values('profit', ascending=False).reset_index(drop=True)
+
+    def _points(self, grid):
+        if grid is None:
+            grid = {}
+        unknown = set(grid.keys()) - set(self.parameters)
+        if unknown:
+            raise TypeError('Unknown sweep parameters: {}'.format(', '.join(sorted(unknown))))
+        fixed = {name: getattr(self._algorithm, name) for name in self.fixed_parameters}
+        # Thresholds vary fastest, so consecutive points share cached indicators
+        names = self.parameters[2:] + self.parameters[:2]
+        values = [grid.get(name, [getattr(self._algorithm, name)]) for name in names]
+        return [dict(fixed, **dict(zip(names, combination))) for combination in itertools.product(*values)]
+
+    def _indicator_parameters(self, point):
+        return tuple(point[name] for name in self.parameters[2:])
+
+    def _share(self, values, typecode):
+        array = RawArray(typecode, max(1, len(values)))
+        view = np.frombuffer(array, dtype=np.float64 if typecode == 'd' else np.int64)
+        view[:len(values)] = values
+        return array
@@ -0,0 +1,108 @@
+from datetime import timedelta
+from multiprocessing import Pool, cpu_count
+
+import pandas as pd
+from dateutil import tz
+
+from algorithms.arbitragealgorithm import ArbitrageAlgorithm
+from models.simulator import BaseSimulator
+
+
+def _replay_shard(task):
+    """
+    Replays one shard in a fresh LiveTrader and returns its (signal_history, trade_history)
+    """
+    from models.trader import LiveTrader
+    dfs, warmup_start, start, end, freq, algorithm, parameters = task
+    algorithm = algorithm()
+    for name, value in parameters.items():
+        setattr(algorithm, name, value)
+    trader = LiveTrader()
+    trader.add_algorithm(algorithm)
+    trader.add_simulator(BaseSimulator(after=warmup_start, before=end, freq=freq))
+    signal_history = trader.replay(dfs, start=start, end=end)
+    return list(signal_history), list(trader.trade_history)
+
+
+class WalkForward:
+    """
+    Replays a long range of trades and order book snapshots as consecutive shards in a process pool.
+    Every shard is preceded by `cutaway` of warm-up data that only feeds the algorithm. Each shard starts
+    without an open position and from the initial equity, and positions still open at its end are not reported.
+    """
+
+    def __init__(self, source_df, orderbook_df, algorithm=ArbitrageAlgorithm, parameters=None, shard='1D',
+                 freq=10, processes=None):
+        """
+        :param source_df: trades dataframe indexed by Time
+        :param orderbook_df: order book dataframe indexed by Time
+        :param algorithm: algorithm class, instantiated in every worker
+        :param parameters: {attribute: value} set on every algorithm instance
+        :param shard: pandas offset string, length of a shard
+        :param freq: simulation step in seconds
+        :param processes: number of worker processes, all cores by default, 1 replays in this process
+        """
+        if processes is None:
+            processes = cpu_count()
+        self._dfs = {'original_source': source_df.sort_index(), 'original_orderbook': orderbook_df.sort_index()}
+        self._algorithm = algorithm
+        self._parameters = parameters or {}
+        self._shard = pd.Timedelta(shard).to_pytimedelta()
+        self._freq = freq
+        self._processes = processes
+
+    def run(self, start=None, end=None):
+        """
+        Returns stitched (signal_history, trade_history) of all shards, ordered by time
+        :param start: datetime, the first data point by default
+        :param end: datetime, the last data point by default
+        :return:
+        """
+        tasks = self._tasks(start, end)
+        if self._processes == 1 or len(tasks) < 2:
+            results = [_replay_shard(task) for task in tasks]
+        else:
+            with Pool(min(self._processes, len(tasks))) as pool:
+                results = pool.map(_replay_shard, tasks, chunksize=1)
+        signal_history = []
+        trade_history = []
+        for signals, trades in results:
+            signal_history.extend(signals)
+            trade_history.extend(trades)
+        return signal_history, trade_history
+
+    def _tasks(self, start, end):
+        if start is None:
+            start = min(df.index[0] for df in self._dfs.values())
+        if end is None:
+            end = max(df.index[-1] for df in self._dfs.values())
+        start = self._to_utc(start)
+        end = self._to_utc(end)
+        freq = timedelta(seconds=self._freq)
+        # Shard boundaries fall on the tick grid of a single replay started at `start`
+        shard = max(freq, freq * (self._shard // freq))
+        warmup = self._algorithm.cutaway
+        tasks = []
+        shard_start = start
+        while shard_start < end:
+            shard_end = min(shard_start + shard, end)
+            warmup_start = shard_start - freq * -(-warmup // freq)
+            dfs = {name: self._slice(df, warmup_start, shard_end) for name, df in self._dfs.items()}
+            tasks.append((dfs, warmup_start, shard_start, shard_end, self._freq, self._algorithm, self._parameters))
+            shard_start = shard_end
+        return tasks
+
+    def _slice(self, df, start, end):
+        index = df.index
+        if index.tz is None:
+            start = start.replace(tzinfo=None)
+            end = end.replace(tzinfo=None)
+        # Keeping one row before `start` pins the simulator caret to `start`, the simulator does not emit it
+        first = max(0, index.searchsorted(start, side='left') - 1)
+        return df.iloc[first:index.searchsorted(end, side='left')]
+
+    def _to_utc(self, value):
+        value = pd.Timestamp(value).to_pydatetime()
+        if value.tzinfo is None:
+            return value.replace(tzinfo=tz.tzutc())
+        return value.astimezone(tz.tzutc())
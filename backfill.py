@@ -0,0 +1,42 @@
+import argparse
+
+from dateutil import parser as dateparser, tz
+
+from constants import currencies, formats, periods
+from constants.constants import STORAGE
+from models.timeseries import TimeSeriesStore
+from sources.backfill import Backfill, ParquetSink
+from sources.historical import BitfinexSource, CryptowatchSource
+
+SOURCES = {
+    'bitfinex': BitfinexSource,
+    'cryptowatch': CryptowatchSource,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumable backfill of historical candles")
+    parser.add_argument('source', choices=sorted(SOURCES.keys()))
+    parser.add_argument('after', help="Start date, e.g. 2018-01-01")
+    parser.add_argument('before', help="End date, e.g. 2018-06-01")
+    parser.add_argument('--period', choices=sorted(periods.SECONDS.keys()), default=periods.P5M)
+    parser.add_argument('--table', help="Table to write candles to")
+    parser.add_argument('--parquet', help="Directory to write Parquet files to")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=1.0, help="Requests per second")
+    parser.add_argument('--cache', default='.backfill', help="Directory of completed pages")
+    args = parser.parse_args()
+
+    source = SOURCES[args.source](currency=currencies.BTC, period=args.period)
+    sink = None
+    if args.table is not None:
+        sink = TimeSeriesStore(name=args.table, columns=formats.candle_format, time_unit="s", storage=STORAGE.ROWS)
+    elif args.parquet is not None:
+        sink = ParquetSink(args.parquet)
+
+    after = dateparser.parse(args.after).replace(tzinfo=tz.tzutc())
+    before = dateparser.parse(args.before).replace(tzinfo=tz.tzutc())
+    backfill = Backfill(source, workers=args.workers, rate=args.rate, cache_dir=args.cache)
+    backfill.run(after, before, sink)
+    if backfill.failed:
+        print("[info] Run again to retry failed pages, completed pages are cached in {}".format(args.cache))
@@ -0,0 +1,33 @@
+import argparse
+
+import pandas as pd
+
+from constants import formats
+from persistence.bulk import BulkCopier
+
+TABLES = {
+    'bitfinex_btcusd': formats.history_format,
+    'kuna_btcuah': formats.history_format,
+    'kuna_orderbook': formats.orderbook_format,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import/export of collected market data")
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('table', choices=sorted(TABLES.keys()))
+    parser.add_argument('filename', help="CSV file indexed by Time")
+    parser.add_argument('--chunksize', type=int, default=50000)
+    args = parser.parse_args()
+
+    store = BulkCopier(name=args.table, columns=TABLES[args.table], time_unit="s", chunksize=args.chunksize)
+
+    if args.action == 'import':
+        chunks = pd.read_csv(args.filename, index_col='Time', parse_dates=True, chunksize=args.chunksize)
+        print("[info] Imported {} rows".format(store.import_df(chunks)))
+    else:
+        total = 0
+        for i, chunk in enumerate(store.export_df()):
+            chunk.to_csv(args.filename, mode='w' if i == 0 else 'a', header=i == 0, index_label='Time')
+            total += len(chunk)
+        print("[info] Exported {} rows".format(total))
@@ -1,11 +1,12 @@
 import pandas as pd
-from time import sleep
 
 from constants import currencies
 from sources.historical import CryptowatchSource, KunaIoSource
 from parsers.rates import orderbook_to_record
+from models.collector import Collector
 from models.timeseries import TimeSeriesStore
 from constants import formats
+from constants.constants import STORAGE
 from datetime import timedelta
 
 
@@ -17,18 +18,22 @@ if __name__ == "__main__":
     target_rates = KunaIoSource(currency=currencies.BTC)
 
     # 1. Pick up where we left off, if any
-    source_store = TimeSeriesStore(name="bitfinex_btcusd", columns=formats.history_format, time_unit="s", time_field="timestamp", update_period=timedelta(seconds=30))
-    target_store = TimeSeriesStore(name="kuna_btcuah", columns=formats.history_format, time_unit="s", update_period=timedelta(seconds=30))
-    orderbook_store = TimeSeriesStore(name="kuna_orderbook", columns=formats.orderbook_format, time_unit="s", update_period=timedelta(seconds=30))
-
-    while True:
-        source_store.write(source_rates.fetch_latest_trades(limit=100))
-        target_store.write(target_rates.fetch_latest_trades())
-        order_book = target_rates.fetch_order_book()
-
-        # Add new order book call
-        record = orderbook_to_record(order_book)
+    source_store = TimeSeriesStore(name="bitfinex_btcusd", columns=formats.history_format, time_unit="s", time_field="timestamp", update_period=timedelta(seconds=30),
+                                   storage=STORAGE.ROWS)
+    target_store = TimeSeriesStore(name="kuna_btcuah", columns=formats.history_format, time_unit="s", update_period=timedelta(seconds=30),
+                                   storage=STORAGE.ROWS)
+    orderbook_store = TimeSeriesStore(name="kuna_orderbook", columns=formats.orderbook_format, time_unit="s", update_period=timedelta(seconds=30),
+                                   storage=STORAGE.ROWS)
+
+    def fetch_order_book():
+        record = orderbook_to_record(target_rates.fetch_order_book())
         if record['timestamp'] is not None:
-            tmp_book = pd.Series(record)
-            orderbook_store.write(tmp_book)
-        sleep(1)
+            return pd.Series(record)
+        return None
+
+    collector = Collector(period=1.0)
+    # Empty lists mean no trades since the previous tick, nothing to write
+    collector.add("source trades", lambda: source_rates.fetch_new_trades(limit=100) or None, source_store)
+    collector.add("target trades", lambda: target_rates.fetch_new_trades(limit=100) or None, target_store)
+    collector.add("order book", fetch_order_book, orderbook_store)
+    collector.run()
@@ -16,3 +16,8 @@ class DECISIONS:
     SELL_ALL = 'SELL_ALL'
     AMBIGUOUS = 'AMBIGUOUS'
     NO_DATA = 'NO_DATA'
+
+
+class STORAGE:
+    TRUNKS = 'TRUNKS'
+    ROWS = 'ROWS'
@@ -1,5 +1,6 @@
 
 history_format = ['timestamp', 'id', 'created_at', 'price', 'volume']
+candle_format = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
 orderbook_format = ['timestamp', 'bid', 'ask', 'bid_volume', 'bid_weight', 'ask_volume', 'ask_weight']
 
 signal_format = [
@@ -10,6 +11,8 @@ signal_format = [
     'decision'
 ]
 
+signal_history_format = signal_format + ['result', 'logged_time']
+
 datastore_records = dict(
     created_at="timestamp with time zone NOT NULL",
     collected_at="timestamp with time zone NOT NULL",
@@ -18,6 +21,12 @@ datastore_records = dict(
     id="bigserial NOT NULL",
 )
 
+datastore_rows = dict(
+    timestamp="double precision NOT NULL",
+    created_at="timestamp with time zone NOT NULL",
+    data="jsonb",
+)
+
 trading_records = dict(
     id="bigserial NOT NULL",
     created_at="timestamp with time zone",
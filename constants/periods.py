@@ -1,4 +1,10 @@
 
 P5M = "P5M"
 P15M = "P15M"
-P30M = "P30M"
\ No newline at end of file
+P30M = "P30M"
+
+SECONDS = {
+    P5M: 5 * 60,
+    P15M: 15 * 60,
+    P30M: 30 * 60
+}
@@ -1,8 +1,94 @@
-import requests
+import threading
+from time import monotonic
+
+from utils import session
+
+PRIVATBANK_RATES_URL = 'https://api.privatbank.ua/p24api/pubinfo?json&exchange&coursid=3'
+
+
+def fetch_UAH_rates():
+    """
+    Returns {currency: mean of PrivatBank buy and sale UAH rates}
+    :return:
+    """
+    response = session.get(PRIVATBANK_RATES_URL).json()
+    return {x['ccy']: float((float(x['buy']) + float(x['sale'])) / 2) for x in response}
+
+
+class RateProvider:
+    """
+    Caches a table of exchange rates for `ttl` seconds. Past `refresh_ahead` of the ttl the cached table is
+    still returned while a background thread refreshes it. When refreshing fails, the last known rates are used
+    and the next attempt is made no sooner than `retry_interval` seconds later.
+    """
+
+    def __init__(self, fetch, ttl=3600, refresh_ahead=0.8, retry_interval=60):
+        """
+        :param fetch: callable returning {currency: rate}
+        :param ttl: seconds the rates are used without waiting for a refresh
+        :param refresh_ahead: fraction of ttl after which rates are refreshed in background
+        :param retry_interval: seconds between attempts after a failed refresh
+        """
+        self._fetch = fetch
+        self._ttl = ttl
+        self._refresh_ahead = refresh_ahead
+        self._retry_interval = retry_interval
+        self._rates = None
+        self._updated = None
+        self._failed = None
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self, currency):
+        now = monotonic()
+        if self._rates is None:
+            self._refresh(blocking=True)
+        elif now - self._updated >= self._ttl * self._refresh_ahead and self._may_retry(now):
+            self._refresh(blocking=now - self._updated >= self._ttl)
+        return self._rates[currency]
+
+    def invalidate(self):
+        self._updated = -float('inf')
+
+    def _may_retry(self, now):
+        return self._failed is None or now - self._failed >= self._retry_interval
+
+    def _refresh(self, blocking):
+        if blocking:
+            with self._update_lock:
+                # Another thread could have refreshed the rates while this one waited
+                if self._rates is None or monotonic() - self._updated >= self._ttl:
+                    self._update()
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_update, name='rate-refresh', daemon=True).start()
+
+    def _background_update(self):
+        try:
+            with self._update_lock:
+                self._update()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _update(self):
+        try:
+            self._rates = self._fetch()
+            self._updated = monotonic()
+            self._failed = None
+        except Exception as e:
+            self._failed = monotonic()
+            if self._rates is None:
+                raise
+            print("[error] Refreshing exchange rates failed, using last known rates: {}".format(e))
+
+
+UAH_RATES = RateProvider(fetch_UAH_rates)
 
 
 def get_UAH_rate(currency="USD"):
-    response = requests.get('https://api.privatbank.ua/p24api/pubinfo?json&exchange&coursid=3').json()
-    result = next((x for x in response if x['ccy'] == currency), 0.0)
-    rate = float((float(result['buy']) + float(result['sale'])) / 2)
-    return rate
+    return UAH_RATES.get(currency)
@@ -0,0 +1,284 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from time import monotonic
+
+from tornado.ioloop import PeriodicCallback
+
+from algorithms.arbitragealgorithm import ArbitrageAlgorithm
+from constants import currencies
+from constants import formats
+from constants.constants import STORAGE
+from models.status_store import StatusStore
+from models.trader import LiveTrader
+from persistence.pandas import PandasReader
+from sources.historical import CryptowatchSource, KunaIoSource
+
+
+class _Session:
+    def __init__(self, doc, plotter=None, console=None, on_live=None):
+        self.doc = doc
+        self.plotter = plotter
+        self.console = console
+        self.on_live = on_live
+
+
+class HubConsole:
+    """
+    Console of the shared trader, every change of its text is copied to the consoles of all sessions
+    """
+
+    def __init__(self, hub):
+        self._hub = hub
+        self._text = ""
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self._text = value
+        self._hub.broadcast(lambda session: setattr(session.console, 'text', value), 'console')
+
+
+class SessionRelay:
+    """
+    Console and graphics of a session trader running off the event loop. Console text and plot refreshes are
+    applied to the session document on its next tick, a refresh still waiting there is replaced by a newer one.
+    """
+
+    def __init__(self, doc, plotter=None, console=None):
+        self._doc = doc
+        self._plotter = plotter
+        self._console = console
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    @property
+    def text(self):
+        with self._lock:
+            if 'text' in self._pending:
+                return self._pending['text'][0]
+        return self._console.text
+
+    @text.setter
+    def text(self, value):
+        self._schedule('text', partial(setattr, self._console, 'text'), value)
+
+    def refresh(self, **dfs):
+        self._schedule('refresh', partial(self._plotter.refresh, **dfs))
+
+    def refresh_indicator(self, name, indicator, col=None):
+        self._schedule(('indicator', name), partial(self._plotter.refresh_indicator, name, indicator, col=col))
+
+    def _schedule(self, key, callback, *args):
+        with self._lock:
+            scheduled = key in self._pending
+            self._pending[key] = args + (callback,)
+        if not scheduled:
+            self._doc.add_next_tick_callback(partial(self._apply, key))
+
+    def _apply(self, key):
+        with self._lock:
+            pending = self._pending.pop(key)
+        pending[-1](*pending[:-1])
+
+
+class DataHub:
+    """
+    Market data and live trading shared by all dashboard sessions of the process. The hub owns the stores,
+    caches their reads for a few seconds so sessions refreshing together share one database query, and runs
+    a single LiveTrader signal loop whose console output, plots and live status are fanned out to every session
+    document with add_next_tick_callback. Dashboard cost does not grow with the number of viewers.
+    Signal ticks and exchange requests run on executors, the server event loop only schedules them and applies
+    their results, so slow exchanges do not freeze the sessions.
+    """
+    read_ttl = 5.0
+    request_workers = 4
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._sessions = []
+        self._reads = {}
+        self._loop = None
+        self._tick = None
+        # One worker keeps signal ticks and reads of the live trader state in order
+        self._signal_executor = ThreadPoolExecutor(max_workers=1)
+        self._request_executor = ThreadPoolExecutor(max_workers=self.request_workers)
+        self.statuses = StatusStore("statuses_store")
+        self.stores = {
+            'source': PandasReader(name="bitfinex_btcusd", columns=formats.history_format, time_unit="s",
+                                   time_field="timestamp", storage=STORAGE.ROWS),
+            'target': PandasReader(name="kuna_btcuah", columns=formats.history_format, time_unit="s",
+                                   x_shift_hours=0, storage=STORAGE.ROWS),
+            'orderbook': PandasReader(name="kuna_orderbook", columns=formats.orderbook_format, time_unit="s",
+                                      storage=STORAGE.ROWS),
+        }
+        self.console = HubConsole(self)
+        self.trader = LiveTrader(
+            name="bitfinex_kuna_arbitrage_trades",
+            console=self.console,
+            columns=formats.history_format,
+            time_unit="s",
+            time_field="timestamp"
+        )
+        self.trader.add_graphics(self)
+        self.trader.add_source_api(CryptowatchSource(currency=currencies.BTC))
+        self.trader.add_target_api(KunaIoSource(currency=currencies.BTC))
+        self.trader.add_algorithm(ArbitrageAlgorithm(console=self.console))
+
+    @property
+    def live(self):
+        return self._loop is not None
+
+    def add_session(self, doc, plotter=None, console=None, on_live=None):
+        """
+        Registers a session document, it receives hub output until its session is destroyed
+        :param doc: bokeh Document
+        :param plotter: ArbitragePlotter refreshed with the live trader plots
+        :param console: PreText receiving the live trader console
+        :param on_live: callable(state) called on changes of the live trading status
+        :return:
+        """
+        session = _Session(doc, plotter, console, on_live)
+        with self._lock:
+            self._sessions.append(session)
+        doc.on_session_destroyed(lambda context: self.remove_session(doc))
+
+    def remove_session(self, doc):
+        with self._lock:
+            self._sessions = [x for x in self._sessions if x.doc is not doc]
+
+    def broadcast(self, callback, attribute=None):
+        """
+        Schedules callback(session) on the next tick of every session document
+        :param callback:
+        :param attribute: only sessions with this attribute set
+        :return:
+        """
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            if attribute is not None and getattr(session, attribute) is None:
+                continue
+            try:
+                session.doc.add_next_tick_callback(partial(callback, session))
+            except Exception as e:
+                print("[error] Dropping dashboard session: {}".format(e))
+                self.remove_session(session.doc)
+
+    def read_latest(self, name, start=None, end=None, trunks=None):
+        """
+        Returns PandasReader.read_latest of a store, reads with the same arguments within `read_ttl` seconds
+        share one query, callers arriving while it runs wait for its result
+        :param name: 'source', 'target' or 'orderbook'
+        :return:
+        """
+        key = (name, start, end, trunks)
+        with self._lock:
+            cached = self._reads.get(key)
+            if cached is None or (cached[0] is not None and monotonic() - cached[0] >= self.read_ttl):
+                # Finished at None while the query of this caller is in flight
+                cached = None
+                future = Future()
+                self._reads = {
+                    x: y for x, y in self._reads.items() if y[0] is None or monotonic() - y[0] < self.read_ttl
+                }
+                self._reads[key] = (None, future)
+        if cached is not None:
+            return cached[1].result()
+        # Queried outside the lock, broadcasts of the signal thread take it too
+        try:
+            df = self.stores[name].read_latest(start=start, end=end, trunks=trunks)
+        except BaseException as e:
+            with self._lock:
+                self._reads.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._reads[key] = (monotonic(), future)
+        future.set_result(df)
+        return df
+
+    def set_live(self, state):
+        """
+        Starts or stops the live signal loop, the status is persisted off the event loop and sent to all sessions
+        :param state:
+        :return:
+        """
+        with self._lock:
+            if bool(state) == self.live:
+                return
+            if state:
+                self._loop = PeriodicCallback(self._schedule_tick, self.trader.get_rate() * 1000)
+                self._loop.start()
+            else:
+                self._loop.stop()
+                self._loop = None
+        # In order with the signal ticks, so the last toggle is the status saved
+        self._signal_executor.submit(self._save_live, state)
+        self.trader.log("Changing live trading to: " + str(state))
+        self.broadcast(lambda session: session.on_live(state), 'on_live')
+
+    def _save_live(self, state):
+        try:
+            self.statuses.set_value("SCRIPT_IS_LIVE", state)
+        except Exception as e:
+            print("[error] Saving live trading status failed: {}".format(e))
+
+    def run_in_executor(self, doc, function, callback=None, serial=False):
+        """
+        Runs function() off the server event loop and callback(result) on the next tick of the document
+        :param doc: bokeh Document
+        :param function: blocking callable, e.g. an exchange request
+        :param callback: callable(result) updating the document
+        :param serial: run in order with the live signal ticks, for reads of the live trader state
+        :return: Future of function()
+        """
+        executor = self._signal_executor if serial else self._request_executor
+        future = executor.submit(function)
+        future.add_done_callback(lambda x: self._deliver(doc, x, callback))
+        return future
+
+    def _deliver(self, doc, future, callback):
+        try:
+            result = future.result()
+        except Exception as e:
+            print("[error] Dashboard request failed: {}".format(e))
+            return
+        if callback is not None:
+            doc.add_next_tick_callback(partial(callback, result))
+
+    def _schedule_tick(self):
+        if self._tick is not None and not self._tick.done():
+            print("[info] Skipping signal tick, previous tick is still running")
+            return
+        self._tick = self._signal_executor.submit(self._signal)
+
+    def _signal(self):
+        try:
+            self.trader.signal_callback()
+        except Exception as e:
+            print("[error] Signal tick failed: {}".format(e))
+
+    def refresh(self, **dfs):
+        self.broadcast(lambda session: session.plotter.refresh(**dfs), 'plotter')
+
+    def refresh_indicator(self, name, indicator, col=None):
+        self.broadcast(lambda session: session.plotter.refresh_indicator(name, indicator, col=col), 'plotter')
+
+
+_HUB = None
+_HUB_LOCK = threading.Lock()
+
+
+def get_hub():
+    """
+    Returns the DataHub of the process, created on first use
+    """
+    global _HUB
+    with _HUB_LOCK:
+        if _HUB is None:
+            _HUB = DataHub()
+        return _HUB
@@ -14,17 +14,14 @@ from bokeh.palettes import Spectral4
 
 from analyzers.simple import BaseArbitrageAnalyzer
 from algorithms.arbitragealgorithm import ArbitrageAlgorithm
-from constants import currencies
-from sources.historical import CryptowatchSource, KunaIoSource
 from parsers.rates import get_rate
-from persistence.pandas import PandasReader
 from models.trader import LiveTrader
 from models.simulator import BaseSimulator
 from models.arbitrageplotter import ArbitragePlotter
 from implementations.kuna import KunaExchange
-from models.status_store import StatusStore
 from constants import formats
 from constants.constants import MONITOR_CHART_NAMES as GLYPHNAMES
+from frontend.hub import get_hub, SessionRelay
 
 DEFAULT_COEFF = 27.0
 USD_LOW = 10000
@@ -63,32 +60,48 @@ def init_plot(y_range=(USD_LOW, USD_HIGH)):
 
 def serve_frontend(doc):
     current_time = datetime.utcnow()
-    statuses = StatusStore("statuses_store")
+    # Stores and the live trading loop are shared by all sessions of the process
+    hub = get_hub()
     console = PreText(text="#>\n", width=500, height=100)
 
-    src_store = PandasReader(name="bitfinex_btcusd", columns=formats.history_format, time_unit="s",
-                             time_field="timestamp")
-    tgt_store = PandasReader(name="kuna_btcuah", columns=formats.history_format, time_unit="s", x_shift_hours=0)
-    ord_store = PandasReader(name="kuna_orderbook", columns=formats.orderbook_format, time_unit="s")
-
-    trader = LiveTrader(
-        name="bitfinex_kuna_arbitrage_trades",
-        console=console,
-        columns=formats.history_format,
-        time_unit="s",
-        time_field="timestamp"
-    )
-
-    src_df = src_store.read_latest(trunks=1)
-    tgt_df = tgt_store.read_latest(trunks=1)
-    ord_df = ord_store.read_latest(trunks=1)
-    source_src = ColumnDataSource(data=dict(Time=src_df.index, price=src_df.price))
-    source_tgt = ColumnDataSource(
-        data=dict(Time=tgt_df.index, price=tgt_df.price, volume=tgt_df['volume'].multiply(100)))
-    source_ord = ColumnDataSource(data=dict(Time=ord_df.index, ask=ord_df.get('ask', []), bid=ord_df.get('bid', [])))
+    # Runs simulations, backtests and manual orders of this session only, created by get_trader on first use
+    trader = None
 
+    # Market data is read off the event loop, None until the first read arrives
+    src_df = None
+    tgt_df = None
+    ord_df = None
     plotter = ArbitragePlotter()
-    trader.add_graphics(plotter)
+
+    def read_frames(**kwargs):
+        return tuple(hub.read_latest(name, **kwargs) for name in ('source', 'target', 'orderbook'))
+
+    def on_frames_read(frames):
+        nonlocal src_df
+        nonlocal tgt_df
+        nonlocal ord_df
+        src_df, tgt_df, ord_df = frames
+
+    hub.run_in_executor(doc, lambda: read_frames(trunks=1), on_frames_read)
+
+    # Plot lines get a level of detail of the raw data fitting the plot width, recomputed on pan and zoom
+    x_range = plotter.get_plot().x_range
+    range_pending = False
+
+    def on_range_rendered():
+        nonlocal range_pending
+        range_pending = False
+        plotter.set_range(x_range.start, x_range.end)
+
+    def on_range_change(attrname, old, new):
+        # A pan or zoom changes the range many times a second, render once it settles
+        nonlocal range_pending
+        if not range_pending:
+            range_pending = True
+            doc.add_timeout_callback(on_range_rendered, 200)
+
+    x_range.on_change('start', on_range_change)
+    x_range.on_change('end', on_range_change)
 
     wgt_start_date = TextInput(title="Start at hours before now:", value='5')
     wgt_end_date = TextInput(title="End at hours before now:", value='0')
@@ -102,20 +115,12 @@ def serve_frontend(doc):
     wgt_refresh = Button(label='Refresh', button_type='success')
 
     def on_refresh():
-        nonlocal src_df
-        nonlocal tgt_df
-        nonlocal ord_df
         try:
-            src_df = src_store.read_latest(start=float(wgt_start_date.value), end=float(wgt_end_date.value))
-            source_src.data = dict(Time=src_df.index, price=src_df.price)
-
-            tgt_df = tgt_store.read_latest(start=float(wgt_start_date.value), end=float(wgt_end_date.value))
-            ord_df = ord_store.read_latest(start=float(wgt_start_date.value), end=float(wgt_end_date.value))
-
-            source_tgt.data = dict(Time=tgt_df.index, price=tgt_df.price, volume=tgt_df['volume'].multiply(100))
-            source_ord.data = dict(Time=ord_df.index, ask=ord_df.ask, bid=ord_df.bid)
+            start, end = float(wgt_start_date.value), float(wgt_end_date.value)
         except BaseException as e:
             print(e)
+            return
+        hub.run_in_executor(doc, lambda: read_frames(start=start, end=end), on_frames_read)
 
     wgt_refresh.on_click(lambda: on_refresh())
 
@@ -131,8 +136,9 @@ def serve_frontend(doc):
     wgt_autoscale = Button(label='Autoscale')
 
     def on_autoscale(button):
-        nonlocal src_df
-        nonlocal ord_df
+        if src_df is None or ord_df is None:
+            console.text += "Market data is still loading\n"
+            return
         rate = get_rate(src_df, ord_df,
                         start=timedelta(hours=(float(wgt_autoscale_starthours.value) + float(wgt_end_date.value))),
                         end=timedelta(hours=(float(wgt_autoscale_endhours.value) + float(wgt_end_date.value)))
@@ -190,14 +196,39 @@ def serve_frontend(doc):
         title="Simulation frequency (seconds):", value="60"
     )
 
+    # Replays run off the event loop, the session trader sends their console output and plots through a relay
+    replay = None
+
+    def run_replay(function):
+        nonlocal replay
+        if replay is not None and not replay.done():
+            console.text += "A simulation is still running\n"
+            return
+        replay = hub.run_in_executor(doc, function, on_replay_finished)
+
+    def on_replay_finished(result):
+        console.text += "Replay finished: {} signals\n".format(len(trader.signal_history))
+
     def on_simulate():
-        trader.simulate(
+        session_trader = get_trader()
+        run_replay(lambda: session_trader.simulate(
             normalized_orderbook='normalized_orderbook.csv',
             normalized_source='normalized_source.csv'
-        )
+        ))
 
     wgt_livesim.on_click(lambda: on_simulate())
 
+    wgt_backtest = Button(label='Backtest', button_type='primary')
+
+    def on_backtest():
+        session_trader = get_trader()
+        run_replay(lambda: session_trader.backtest(
+            original_orderbook='original_orderbook.csv',
+            original_source='original_source.csv'
+        ))
+
+    wgt_backtest.on_click(lambda: on_backtest())
+
     analyzer_inputs = widgetbox(
         wgt_refresh,
         wgt_start_date,
@@ -211,6 +242,7 @@ def serve_frontend(doc):
         wgt_analyze_end,
         # fixate,
         wgt_livesim,
+        wgt_backtest,
         wgt_livesim_start,
         wgt_livesim_end,
         wgt_livesim_freq,
@@ -220,15 +252,27 @@ def serve_frontend(doc):
     text_publickey = TextInput(title="Public Key:", value=str(KUNA_AUTH.get('public_key')))
     text_secretkey = TextInput(title="Secret Key:", value=str(KUNA_AUTH.get('secret_key')))
 
-    trader.add_trader_api(KunaExchange(text_publickey, text_secretkey))
-    trader.add_source_api(CryptowatchSource(currency=currencies.BTC))
-    trader.add_target_api(KunaIoSource(currency=currencies.BTC))
-    trader.add_algorithm(ArbitrageAlgorithm(console=console))
-    trader.add_simulator(BaseSimulator(
-        after=wgt_livesim_start,
-        before=wgt_livesim_end,
-        freq=wgt_livesim_freq
-    ))
+    def get_trader():
+        # Most sessions only watch the live trader, a trader of their own is built once they need it
+        nonlocal trader
+        if trader is None:
+            relay = SessionRelay(doc, plotter=plotter, console=console)
+            trader = LiveTrader(
+                name="bitfinex_kuna_arbitrage_trades",
+                console=relay,
+                columns=formats.history_format,
+                time_unit="s",
+                time_field="timestamp"
+            )
+            trader.add_graphics(relay)
+            trader.add_trader_api(KunaExchange(text_publickey, text_secretkey))
+            trader.add_algorithm(ArbitrageAlgorithm(console=relay))
+            trader.add_simulator(BaseSimulator(
+                after=wgt_livesim_start,
+                before=wgt_livesim_end,
+                freq=wgt_livesim_freq
+            ))
+        return trader
 
     buy_all_button = Button(label='Buy All', button_type='success')
     sell_all_button = Button(label='Sell All', button_type='danger')
@@ -236,43 +280,53 @@ def serve_frontend(doc):
 
     button_livetrade = Toggle(label='[Live Trade]', button_type='primary')
     button_liveexecution = Toggle(label='☑ Execute', button_type='danger')
-    algo_cycle_rate = trader.get_rate() * 1000
 
     def on_trade_toggle(button, state):
-        statuses.set_value("SCRIPT_IS_LIVE", state)
-        trader.log("Changing live trading to: " + str(state))
-        if state:
-            doc.add_periodic_callback(trader.signal_callback, algo_cycle_rate)
-        else:
-            doc.remove_periodic_callback(trader.signal_callback)
+        hub.set_live(state)
 
     button_livetrade.on_click(lambda x: on_trade_toggle(button_livetrade, x))
-    if statuses.get_value("SCRIPT_IS_LIVE"):
+
+    def on_live(state):
+        button_livetrade.active = state
+
+    def on_live_status(status):
+        if status:
+            button_livetrade.active = True
+
+    hub.add_session(doc, plotter=plotter, console=console, on_live=on_live)
+    if hub.live:
         button_livetrade.active = True
+    else:
+        # Live trading saved by a previous process is read off the event loop
+        hub.run_in_executor(doc, lambda: hub.statuses.get_value("SCRIPT_IS_LIVE"), on_live_status)
+
+    def on_order_result(result):
+        console.text += json.dumps(result, indent=2) + "\n"
 
+    # Exchange round-trips run off the event loop, results are printed when they arrive
     def on_buy(button):
         console.text = "[{}] BUY order placed:\n".format(datetime.now())
-        console.text += json.dumps(trader.buy_all(), indent=2) + "\n"
+        hub.run_in_executor(doc, get_trader().buy_all, on_order_result)
 
     buy_all_button.on_click(lambda: on_buy(buy_all_button))
 
     def on_sell(button):
         console.text = "[{}] SELL order placed for {}\n".format(datetime.now(), 1.1203)
-        console.text += json.dumps(trader.sell_all(), indent=2) + "\n"
+        hub.run_in_executor(doc, get_trader().sell_all, on_order_result)
 
     sell_all_button.on_click(lambda: on_sell(sell_all_button))
 
     def on_cancel(button):
         console.text = "[{}] Cancelled orders\n".format(datetime.now())
-        console.text += json.dumps(trader.cancel_all(), indent=2) + "\n"
+        hub.run_in_executor(doc, get_trader().cancel_all, on_order_result)
 
     cancel_all_button.on_click(lambda: on_cancel(cancel_all_button))
 
     testbutton_debugsignal = Toggle(label='☑ Debug Signal')
 
     def on_debugsignal(state):
-        trader.log('[debug] signal emulation: ' + str(state))
-        trader.emulate_signals(state)
+        hub.trader.log('[debug] signal emulation: ' + str(state))
+        hub.trader.emulate_signals(state)
 
     testbutton_debugsignal.on_click(lambda x: on_debugsignal(x))
 
@@ -302,13 +356,27 @@ def serve_frontend(doc):
         table2
     )
 
+    def load_tables(count_to_load):
+        # Signals of a simulation run in this session, live signals otherwise
+        shown = trader if trader is not None and len(trader.signal_history) > 0 else hub.trader
+        data = shown.signal_history.view(count_to_load)
+        signals = {column: values.tolist() for column, values in data.items()}
+        indicators = None
+        if shown.algorithm.latest_dataframe is not None:
+            series = shown.algorithm.latest_dataframe.tail(count_to_load).to_dict()
+            indicators = {'timestamp': list(series.keys()), 'indicator': list(series.values())}
+        return signals, indicators
+
+    def on_tables_loaded(tables):
+        signals, indicators = tables
+        table1_source.data = signals
+        if indicators is not None:
+            table2_source.data = indicators
+
     def on_update_tables(button):
         count_to_load = int(lines_to_load.value)
-        data = pd.DataFrame.from_records(trader.signal_history).tail(count_to_load)
-        table1_source.data = data.to_dict(orient='list')
-        if trader.algorithm.latest_dataframe is not None:
-            series = trader.algorithm.latest_dataframe.tail(count_to_load).to_dict()
-            table2_source.data = {'timestamp': list(series.keys()), 'indicator': list(series.values())}
+        # Read in order with the live signal ticks, which append to the live history
+        hub.run_in_executor(doc, lambda: load_tables(count_to_load), on_tables_loaded, serial=True)
 
     execute_datafeed_button.on_click(lambda: on_update_tables(execute_datafeed_button))
 
@@ -9,3 +9,6 @@ class BaseAlgorithm:
 
     def signal(self, *args, **kwargs):
         raise NotImplementedError('Implement self.signal()')
+
+    def on_events(self, source_df, order_book, current_datetime):
+        raise NotImplementedError('Implement self.on_events()')
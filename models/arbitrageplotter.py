@@ -1,3 +1,5 @@
+import numpy as np
+import pandas as pd
 from bokeh.models import ColumnDataSource, Range1d, LinearAxis, DatetimeTicker, CustomJS
 from bokeh.plotting import figure
 from bokeh.palettes import Spectral10, Spectral4
@@ -8,18 +10,203 @@ USD_LOW = 10000
 USD_HIGH = 12000
 
 
-class ArbitragePlotter:
+def _same(a, b):
+    with np.errstate(invalid='ignore'):
+        return (a == b) | (np.isnan(a) & np.isnan(b))
+
+
+def to_milliseconds(index):
+    """
+    Returns float array of milliseconds since epoch, the unit of Bokeh datetime axes, NaN for NaT
+    :param index: DatetimeIndex, naive times are UTC
+    :return:
+    """
+    index = pd.DatetimeIndex(index)
+    result = index.values.astype('datetime64[ns]').view(np.int64) / 1e6
+    result[index.isnull()] = np.nan
+    return result
+
+
+def downsample_positions(times, columns, width):
+    """
+    Returns sorted positions of the first, last, lowest and highest rows of every `width` long time bucket,
+    so a line drawn through them keeps every spike of the full data. Buckets are aligned to multiples of width,
+    appending rows changes only the last bucket.
+    :param times: sorted times
+    :param columns: value arrays aligned with times
+    :param width: bucket length in units of times
+    :return:
+    """
+    length = len(times)
+    buckets = np.floor(np.asarray(times, dtype=np.float64) / width)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]]) if length else np.arange(0)
+    if len(starts) * 4 >= length:
+        return np.arange(length)
+    counts = np.diff(np.r_[starts, length])
+    keep = [starts, starts + counts - 1]
+    for values in columns:
+        values = np.asarray(values, dtype=np.float64)
+        for reduce in (np.fmin, np.fmax):
+            extreme = np.repeat(reduce.reduceat(values, starts), counts)
+            hits = np.flatnonzero(values == extreme)
+            hit_buckets = buckets[hits]
+            keep.append(hits[np.r_[True, hit_buckets[1:] != hit_buckets[:-1]]] if len(hits) else hits)
+    return np.unique(np.concatenate(keep))
+
+
+class StreamingSource:
+    """
+    Keeps a ColumnDataSource in sync with time ordered data and sends browsers only what changed: rows after
+    the ones it holds are streamed, revised values of rows it holds are patched, and rows older than the data
+    are rolled over. The data is replaced as a whole only when it does not continue what the source holds.
+    """
+
+    def __init__(self, source=None, columns=(), rollover=None):
+        """
+        :param source: ColumnDataSource with a Time column, created with `columns` if None
+        :param columns: value columns of a created source
+        :param rollover: maximum number of rows kept, unbounded if None
+        """
+        if source is None:
+            source = ColumnDataSource(data=dict(Time=[], **{column: [] for column in columns}))
+        self.source = source
+        self.rollover = rollover
+        # Mirror of the rows browsers hold, times as milliseconds since epoch like Bokeh sends them
+        self._held = None
+
+    def update(self, index, **columns):
+        """
+        Makes the source hold the latest `rollover` rows of the data
+        :param index: DatetimeIndex of the rows
+        :param columns: {column: values} aligned with index
+        :return:
+        """
+        data = {'Time': to_milliseconds(index)}
+        for column, values in columns.items():
+            # Copied, the mirror must not change with the caller's arrays
+            data[column] = np.array(values, dtype=np.float64)
+        if self.rollover is not None and len(data['Time']) > self.rollover:
+            data = {column: values[-self.rollover:] for column, values in data.items()}
+        length = len(data['Time'])
+        held = self._held
+        if held is None or set(held) != set(data) or length == 0 or len(held['Time']) == 0:
+            self._replace(data)
+            return
+        first = int(np.searchsorted(held['Time'], data['Time'][0]))
+        overlap = len(held['Time']) - first
+        if overlap > length or not _same(held['Time'][first:], data['Time'][:overlap]).all():
+            self._replace(data)
+            return
+        patches = {}
+        for column, values in data.items():
+            changed = np.flatnonzero(~_same(held[column][first:], values[:overlap]))
+            if len(changed):
+                patches[column] = [
+                    (first + int(x), None if np.isnan(values[x]) else float(values[x])) for x in changed
+                ]
+        if patches:
+            self.source.patch(patches)
+        if overlap < length:
+            # Rolling over to the data length also drops held rows older than the data
+            self.source.stream({column: values[overlap:] for column, values in data.items()}, rollover=length)
+            self._held = data
+        else:
+            self._held = {column: np.concatenate([held[column][:first], values]) for column, values in data.items()}
+
+    def _replace(self, data):
+        self.source.data = dict(data)
+        self._held = data
 
+
+class DownsampledSource:
+    """
+    Keeps full resolution time ordered data and feeds a StreamingSource with its level of detail for a visible
+    time range: every pixel wide bucket of the range and of one range width on both sides of it is reduced to its
+    first, last, lowest and highest rows. Bucket widths are powers of two milliseconds, so panning and appended
+    rows leave the buckets in place and only change the rows at the edges.
+    """
+
+    def __init__(self, source=None, columns=(), pixels=1200, rollover=None):
+        """
+        :param source: ColumnDataSource with a Time column, created with `columns` if None
+        :param columns: value columns of a created source
+        :param pixels: width of the plot the source is drawn on
+        :param rollover: maximum number of rows kept, unbounded if None
+        """
+        self.stream = StreamingSource(source, columns, rollover)
+        self.source = self.stream.source
+        self.pixels = pixels
+        self._index = None
+        self._times = None
+        self._columns = {}
+        self._range = (None, None)
+
+    def update(self, index, **columns):
+        """
+        Replaces the full resolution data and sends its level of detail for the current range
+        :param index: DatetimeIndex of the rows
+        :param columns: {column: values} aligned with index
+        :return:
+        """
+        times = to_milliseconds(index)
+        order = np.flatnonzero(~np.isnan(times))
+        order = order[np.argsort(times[order], kind='mergesort')]
+        self._index = pd.DatetimeIndex(index)[order]
+        self._times = times[order]
+        self._columns = {column: np.asarray(values, dtype=np.float64)[order] for column, values in columns.items()}
+        self._render()
+
+    def set_range(self, start=None, end=None):
+        """
+        Sends the level of detail for a visible range, all data is visible if a bound is None
+        :param start: datetime or milliseconds since epoch, as Bokeh datetime ranges hold it
+        :param end: datetime or milliseconds since epoch
+        :return:
+        """
+        self._range = (self._to_milliseconds(start), self._to_milliseconds(end))
+        self._render()
+
+    def _render(self):
+        if self._times is None:
+            return
+        times = self._times
+        start, end = self._range
+        if len(times) and (start is None or end is None):
+            start, end = times[0], times[-1]
+        positions = np.arange(0)
+        if len(times):
+            span = max(end - start, 1.0)
+            width = 2.0 ** np.ceil(np.log2(max(span / self.pixels, 1.0)))
+            # Whole buckets only, a bucket cut by the range edge would be reduced to different rows
+            first = int(np.searchsorted(times, np.floor((start - span) / width) * width, side='left'))
+            last = int(np.searchsorted(times, (np.floor((end + span) / width) + 1) * width, side='left'))
+            positions = first + downsample_positions(
+                times[first:last], [values[first:last] for values in self._columns.values()], width
+            )
+        self.stream.update(
+            self._index[positions], **{column: values[positions] for column, values in self._columns.items()}
+        )
+
+    def _to_milliseconds(self, value):
+        if value is None or isinstance(value, (int, float)):
+            return value
+        return to_milliseconds([value])[0]
+
+
+class ArbitragePlotter:
     def __init__(self):
         self._plot = self.init_plot()
-        self._source_src = ColumnDataSource(data=dict(Time=[], price=[]))
-        self._source_ord = ColumnDataSource(data=dict(Time=[], ask=[], bid=[]))
-        self._plot.line('Time', 'price', source=self._source_src, line_width=3, color=Spectral4[0], alpha=0.8,
+        # Lines get the level of detail of their data fitting the plot width, recomputed by set_range
+        self._range = (None, None)
+        self._source_src = DownsampledSource(columns=['price'], pixels=self._plot.plot_width)
+        self._source_ord = DownsampledSource(columns=['ask', 'bid'], pixels=self._plot.plot_width)
+        self._lines = {}
+        self._plot.line('Time', 'price', source=self._source_src.source, line_width=3, color=Spectral4[0], alpha=0.8,
                         legend="SRC",
                         line_join='round', name=GLYPHNAMES.SOURCE)
-        self._plot.line('Time', 'bid', source=self._source_ord, line_width=1, color=Spectral4[2], alpha=1, legend="Bid",
+        self._plot.line('Time', 'bid', source=self._source_ord.source, line_width=1, color=Spectral4[2], alpha=1, legend="Bid",
                         y_range_name="BTCUAH", line_join='round', name=GLYPHNAMES.TGT_BID)
-        self._plot.line('Time', 'ask', source=self._source_ord, line_width=1, color=Spectral4[3], alpha=1, legend="Ask",
+        self._plot.line('Time', 'ask', source=self._source_ord.source, line_width=1, color=Spectral4[3], alpha=1, legend="Ask",
                         y_range_name="BTCUAH", line_join='round', name=GLYPHNAMES.TGT_ASK)
 
     def init_plot(self, y_range=(USD_LOW, USD_HIGH)):
@@ -43,12 +230,23 @@ class ArbitragePlotter:
     def refresh(self, **dataframes):
         src_df = [value for key, value in dataframes.items() if 'source' in key.lower()][0]
         ord_df = [value for key, value in dataframes.items() if 'orderbook' in key.lower()][0]
-        self._source_src.data = dict(Time=src_df.index, price=src_df.price)
-        self._source_ord.data = dict(Time=ord_df.index, ask=ord_df.ask, bid=ord_df.bid)
+        self._source_src.update(src_df.index, price=src_df.price)
+        self._source_ord.update(ord_df.index, ask=ord_df.ask, bid=ord_df.bid)
 
     def get_plot(self):
         return self._plot
 
+    def set_range(self, start=None, end=None):
+        """
+        Sends all lines the level of detail for a visible time range, e.g. the x_range after a pan or zoom
+        :param start: datetime or milliseconds since epoch, all data is visible if a bound is None
+        :param end: datetime or milliseconds since epoch
+        :return:
+        """
+        self._range = (start, end)
+        for source in [self._source_src, self._source_ord] + list(self._lines.values()):
+            source.set_range(start, end)
+
     def refresh_indicator(self, name, indicator, col=None):
         self._line(name, indicator, col=col, color=Spectral10[9])
 
@@ -58,10 +256,10 @@ class ArbitragePlotter:
             col = 'indicator'
         line = self._plot.select_one(name)
         if line is None:
-            line_cds = ColumnDataSource(data=dict(Time=series.index, indicator=series[col]))
-            line = self._plot.line('Time', 'indicator', source=line_cds, line_width=2, color=color, alpha=0.9,
-                                   legend="Indicator " + name,
+            self._lines[name] = DownsampledSource(columns=['indicator'], pixels=self._plot.plot_width)
+            self._lines[name].set_range(*self._range)
+            line = self._plot.line('Time', 'indicator', source=self._lines[name].source, line_width=2, color=color,
+                                   alpha=0.9, legend="Indicator " + name,
                                    y_range_name="UNITLESS", line_join='round', name=name)
-        else:
-            line.data_source.data = (dict(Time=series.index, indicator=series[col]))
+        self._lines[name].update(series.index, indicator=series[col])
         return line
@@ -0,0 +1,97 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from time import monotonic
+
+
+class Collector:
+    """
+    Samples market data at fixed wall-clock ticks. The fetches of a tick run concurrently in a thread pool,
+    and a single writer thread puts their results to the stores, so a slow exchange or a slow database write
+    delays neither the other fetches nor the next tick. A fetch still running when its next tick comes is not
+    started again for that tick.
+    """
+
+    def __init__(self, period=1.0, workers=None):
+        """
+        :param period: seconds between ticks
+        :param workers: fetch threads, one per job by default
+        """
+        self.period = period
+        self.ticks = 0
+        self.skipped = 0
+        self._workers = workers
+        self._jobs = []
+        self._running = {}
+        self._queue = Queue()
+        self._stopped = threading.Event()
+        self._executor = None
+        self._writer = None
+
+    def add(self, name, fetch, store):
+        """
+        Adds a job fetching data every tick
+        :param name: job name used in log messages
+        :param fetch: callable returning data for store.write(), or None when there is nothing to write
+        :param store: object with a write(data) method
+        :return:
+        """
+        self._jobs.append((name, fetch, store))
+
+    def run(self, ticks=None):
+        """
+        Runs ticks until stop() is called or `ticks` ticks have run, then waits for pending writes
+        :param ticks: number of ticks, unlimited if None
+        :return:
+        """
+        self._stopped.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self._workers or max(1, len(self._jobs)))
+        self._writer = threading.Thread(target=self._write_loop, name='collector-writer', daemon=True)
+        self._writer.start()
+        start = monotonic()
+        slot = 0
+        try:
+            while not self._stopped.is_set() and (ticks is None or self.ticks < ticks):
+                self._tick()
+                self.ticks += 1
+                # Next slot on the fixed grid, slots that passed while the tick ran are skipped
+                slot = max(slot + 1, int((monotonic() - start) // self.period) + 1)
+                self.skipped = slot - self.ticks
+                self._stopped.wait(max(0.0, start + slot * self.period - monotonic()))
+        finally:
+            self._executor.shutdown(wait=True)
+            self._queue.put(None)
+            self._writer.join()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _tick(self):
+        for name, fetch, store in self._jobs:
+            running = self._running.get(name)
+            if running is not None and not running.done():
+                print("[info] Skipping {}, previous fetch is still running".format(name))
+                continue
+            future = self._executor.submit(fetch)
+            future.add_done_callback(lambda x, name=name, store=store: self._done(name, store, x))
+            self._running[name] = future
+
+    def _done(self, name, store, future):
+        try:
+            data = future.result()
+        except Exception as e:
+            print("[error] Fetching {} failed: {}".format(name, e))
+            return
+        if data is not None:
+            self._queue.put((name, store, data))
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            name, store, data = item
+            try:
+                store.write(data)
+            except Exception as e:
+                print("[error] Writing {} failed: {}".format(name, e))
@@ -4,7 +4,7 @@ from collections import OrderedDict
 from datetime import datetime
 from urllib.parse import urlencode
 
-import requests
+from utils import session
 
 
 class BaseExchangeInterface(object):
@@ -45,7 +45,7 @@ class BaseExchangeInterface(object):
 
     def latest_orderbook(self):
         params = dict(market='btcuah')
-        return requests.get(self.urls['base_url'] + self.urls['orderbook_url'], params=params).json()
+        return session.get(self.urls['base_url'] + self.urls['orderbook_url'], params=params).json()
 
     def _get_params(self):
         return dict(
@@ -67,7 +67,7 @@ class BaseExchangeInterface(object):
         enc_params = urlencode(params)
         signature = self._sign("POST", uri, enc_params)
         prepared_params = dict(**params, signature=signature)
-        return requests.post(self.urls['base_url'] + uri, params=prepared_params)
+        return session.post(self.urls['base_url'] + uri, params=prepared_params)
 
     def _get(self, uri, params=None):
         if params is None:
@@ -77,7 +77,7 @@ class BaseExchangeInterface(object):
         enc_params = urlencode(params)
         signature = self._sign("GET", uri, enc_params)
         prepared_params = dict(**params, signature=signature)
-        return requests.get(self.urls['base_url'] + uri, params=prepared_params)
+        return session.get(self.urls['base_url'] + uri, params=prepared_params)
 
     def _check_error(self, response, default_value=None):
         if 'error' in response:
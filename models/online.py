@@ -2,10 +2,8 @@ from datetime import timedelta, datetime
 from sys import getsizeof
 
 import pandas as pd
-from pandas.core.base import DataError
-from psycopg2.extras import Json
 
-from persistence.postgre import BaseSQLStore, url
+from objects.dataframes import prepare_dataframe
 
 
 class OnlineStore(object):
@@ -26,25 +24,7 @@ class OnlineStore(object):
         :param data:
         :return:
         """
-        if isinstance(data, pd.Series):
-            data = [data]
-        df = pd.DataFrame(data, columns=self._columns).groupby(self._time_field)
-        columns = []
-        for column in self._columns:
-            if column != 'volume':
-                try:
-                    series = df[column].mean()
-                except DataError as e:
-                    series = df[column].first()
-            else:
-                series = df[column].sum()
-            columns.append(series)
-        df = pd.concat(columns, axis=1)
-        df['Time'] = pd.to_datetime(df[self._time_field], unit=self._time_unit)
-        df.set_index('Time', inplace=True)
-        del data, columns
-        df.sort_index(inplace=True)
-        return df
+        return prepare_dataframe(data, self._columns, time_field=self._time_field, time_unit=self._time_unit)
 
     def _internal_to_df(self, data):
         _df = pd.DataFrame.from_dict(data, orient='index')
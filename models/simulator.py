@@ -1,10 +1,22 @@
 from datetime import datetime, timedelta
 import dateutil
+import numpy as np
+import pandas as pd
 from utils.timing import user_input_to_utc_time
 from types import SimpleNamespace
 import itertools
 
 
+def _to_datetime64(dt):
+    """
+    Returns naive UTC numpy datetime64[ns] of a naive (treated as UTC) or aware datetime
+    """
+    dt = pd.Timestamp(dt)
+    if dt.tzinfo is not None:
+        dt = dt.tz_convert(None)
+    return dt.to_datetime64()
+
+
 class BaseSimulator:
     normalized_names = ['normalized_orderbook', 'normalized_source']
     orignial_names = ['original_orderbook', 'original_source']
@@ -19,6 +31,7 @@ class BaseSimulator:
         self._current_caret_start = None
         self._start = None
         self._named_dataframes = {}
+        self._cursors = {}
 
     def add_dataframe(self, df, name=None):
         if name is None:
@@ -40,12 +53,12 @@ class BaseSimulator:
 
     def _prepare_params(self):
         rv = SimpleNamespace()
-        before = str(self._before.value if getattr(self._before, 'value') else self._before)
-        after = str(self._after.value if getattr(self._after, 'value') else self._after)
+        before = str(self._before.value if getattr(self._before, 'value', None) else self._before)
+        after = str(self._after.value if getattr(self._after, 'value', None) else self._after)
         rv.before, _ = user_input_to_utc_time(before)
         rv.after, _ = user_input_to_utc_time(after)
         try:
-            rv.freq = timedelta(seconds=float(self._freq.value if getattr(self._freq, 'value') else self._freq))
+            rv.freq = timedelta(seconds=float(self._freq.value if getattr(self._freq, 'value', None) else self._freq))
         except:
             rv.freq = timedelta(seconds=10)
         earliest_start = min(df.index[0] for i, df in self._named_dataframes.items()).replace(tzinfo=dateutil.tz.tzutc())
@@ -54,24 +67,64 @@ class BaseSimulator:
         return rv
 
     def _stop_condition(self):
-        condition = all(len(df[df.index > self._current_caret_start]) == 0 for i, df in self._named_dataframes.items())
-        return condition
+        caret = _to_datetime64(self._current_caret_start)
+        return all(len(times) == 0 or times[-1] <= caret for df, times, start, end in self._cursors.values())
+
+    def _init_cursors(self):
+        """
+        Sorts every dataframe once and finds the position of the simulation start in it.
+        Steps then only advance the end cursor, views are positional slices of the sorted frames.
+        """
+        self._cursors = {}
+        start = _to_datetime64(self._start)
+        for key, df in self._named_dataframes.items():
+            if not df.index.is_monotonic_increasing:
+                df = df.sort_index(kind='mergesort')
+            times = df.index.values.astype('datetime64[ns]')
+            position = int(np.searchsorted(times, start, side='left'))
+            self._cursors[key] = [df, times, position, position]
 
     def __iter__(self):
         self._options = self._prepare_params()
+        self._init_cursors()
         return self
 
     def __next__(self):
+        self._advance()
+        return {key: df.iloc[start:max(start, end)] for key, (df, times, start, end) in self._cursors.items()}
+
+    def events(self, until=None):
+        """
+        Yields (time, {name: rows added since the previous tick}) for the same ticks iteration produces,
+        so consumers keeping their own state receive every row exactly once
+        :param until: keep ticking up to this datetime even after the dataframes are exhausted
+        """
+        iter(self)
+        while True:
+            try:
+                previous = self._advance(until)
+            except StopIteration:
+                return
+            yield self.get_time(), {
+                key: df.iloc[previous[key]:end] for key, (df, times, start, end) in self._cursors.items()
+            }
+
+    def _advance(self, until=None):
+        """
+        Moves the caret one step forward and returns end cursors of the previous step
+        """
         if self._options.freq is None:
             raise TypeError('Option `freq` should be of timedelta type for Simulator object')
-        if self._stop_condition():
+        if self._stop_condition() and (until is None or self._current_caret_start >= until):
             raise StopIteration
-        rv = {}
+        previous = {}
         end_date = self._current_caret_start + self._options.freq
         if self._options.before is not None and end_date > self._options.before:
             end_date = self._options.before
-        for key, df in self._named_dataframes.items():
-            view = df.loc[(df.index >= self._start) & (df.index < end_date)]
-            rv[key] = view
+        end_date = _to_datetime64(end_date)
+        for key, cursor in self._cursors.items():
+            times, end = cursor[1], cursor[3]
+            previous[key] = end
+            cursor[3] = end + int(np.searchsorted(times[end:], end_date, side='left'))
         self._current_caret_start += self._options.freq
-        return rv
+        return previous
@@ -1,4 +1,5 @@
 from persistence.postgre import BaseSQLStore
+from persistence.simple_store import memory_table
 from constants.formats import status_records
 from datetime import datetime
 
@@ -9,37 +10,42 @@ class StatusStore(BaseSQLStore):
         super().__init__(name, format=status_records)
 
     def get_value(self, name):
-        connection = self._ensure_connection(ensure_table=True)
-        cur = connection.cursor()
+        if self._offline:
+            return memory_table(self.name).get(name)
         command = """
         select value from public.{name}
         WHERE name=(%s);
         """.format(name=self.name)
-        try:
-            cur.execute(command, (name, ))
-            connection.commit()
-            data = cur.fetchone()[0]
+        with self._connection(ensure_table=True) as connection:
+            cur = connection.cursor()
+            try:
+                cur.execute(command, (name, ))
+                connection.commit()
+                data = cur.fetchone()[0]
 
-        except BaseException as e:
-            data = None
-        finally:
-            cur.close()
+            except BaseException as e:
+                data = None
+            finally:
+                cur.close()
         return data
 
     def set_value(self, name, value):
-        connection = self._ensure_connection(ensure_table=True)
-        cur = connection.cursor()
+        if self._offline:
+            memory_table(self.name)[name] = value
+            return value
         command = """
         insert into public.{name} (created_at, name, value) values (%s, %s, %s)
         ON CONFLICT (name) DO UPDATE SET created_at=(%s), value=(%s);
         """.format(name=self.name)
         created_at = datetime.utcnow()
-        try:
-            cur.execute(command, (created_at, name, value, created_at, value))
-            connection.commit()
-            rv = value
-        except BaseException as e:
-            rv = None
-        finally:
-            cur.close()
+        with self._connection(ensure_table=True) as connection:
+            cur = connection.cursor()
+            try:
+                cur.execute(command, (created_at, name, value, created_at, value))
+                connection.commit()
+                rv = value
+            except BaseException as e:
+                rv = None
+            finally:
+                cur.close()
         return rv
@@ -2,17 +2,22 @@ from datetime import timedelta, datetime
 from sys import getsizeof
 
 import pandas as pd
-from pandas.core.base import DataError
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_values
 
-from persistence.postgre import BaseSQLStore, url
+from persistence.postgre import BaseSQLStore
+from persistence.simple_store import memory_table
+from objects.dataframes import prepare_dataframe
+from constants.constants import STORAGE
+from constants.formats import datastore_rows
 
 
 class TimeSeriesStore(BaseSQLStore):
 
     def __init__(self, name, columns, update_period=None, time_field='timestamp', time_unit=None, duplicates_field=None,
-                 x_shift_hours=0):
+                 x_shift_hours=0, storage=None):
         super().__init__(name)
+        if storage is None:
+            storage = STORAGE.TRUNKS
         if update_period is None:
             update_period = timedelta(seconds=60)
         self._columns = columns
@@ -34,25 +39,38 @@ class TimeSeriesStore(BaseSQLStore):
             'metadata',
             'id'
         ]
+        # In-memory database keeps rows only
+        self._storage = STORAGE.ROWS if self._offline else storage
+        self._rows_name = "{}_rows".format(name)
+        self._rows_connected = False
+        self._rows_per_trunk = 1000
 
     def write(self, data):
         self._ensure_cache()
         df = self._prepare_data(data).truncate(before=self._trunk_opened_datetime)
         self._update_cache(df)
 
+    def flush(self):
+        """
+        Persists cached rows without waiting for the update period
+        :return:
+        """
+        if self._local_cache:
+            self._perform_persist()
+
     def _get_initial_store(self):
         if not self._table_connected:
             self._connect_table()
-        connection = self._ensure_connection()
-        cur = connection.cursor()
         command = """
         select * from public.{name}
         order by id desc 
         limit 1
         ;
         """.format(name=self.name)
-        cur.execute(command)
-        res = cur.fetchall()
+        with self._connection() as connection:
+            cur = connection.cursor()
+            cur.execute(command)
+            res = cur.fetchall()
         prepared_result = [self._row(x) for x in res]
         result_dict, trunk_start_time, trunk_id = self._remote_to_dict(prepared_result)
         if trunk_id is None:
@@ -65,8 +83,6 @@ class TimeSeriesStore(BaseSQLStore):
     def _start_new_trunk(self, data):
         if not self._table_connected:
             self._connect_table()
-        connection = self._ensure_connection()
-        cur = connection.cursor()
         command = """
         insert into public.{name} (created_at, collected_at, data, metadata) values (%s, %s, %s, %s) returning id;
         """.format(name=self.name)
@@ -74,17 +90,19 @@ class TimeSeriesStore(BaseSQLStore):
         collected_at = datetime.utcnow()
         data = Json(data)
         metadata = Json({})
-        try:
-            cur.execute(command, (created_at, collected_at, data, metadata))
-            connection.commit()
-            new_id = cur.fetchone()[0]
-            self._trunk_opened_datetime = created_at
-            self._current_trunk_id = new_id
-        except BaseException as e:
-            print("[error] New trunk creation failed!")
-            new_id = None
-        finally:
-            cur.close()
+        with self._connection() as connection:
+            cur = connection.cursor()
+            try:
+                cur.execute(command, (created_at, collected_at, data, metadata))
+                connection.commit()
+                new_id = cur.fetchone()[0]
+                self._trunk_opened_datetime = created_at
+                self._current_trunk_id = new_id
+            except BaseException as e:
+                print("[error] New trunk creation failed!")
+                new_id = None
+            finally:
+                cur.close()
         return new_id
 
     def _prepare_data(self, data):
@@ -94,25 +112,7 @@ class TimeSeriesStore(BaseSQLStore):
         :return:
         """
         self._ensure_cache()
-        if isinstance(data, pd.Series):
-            data = [data]
-        df = pd.DataFrame(data, columns=self._columns).groupby(self._time_field)
-        columns = []
-        for column in self._columns:
-            if column != 'volume':
-                try:
-                    series = df[column].mean()
-                except DataError as e:
-                    series = df[column].first()
-            else:
-                series = df[column].sum()
-            columns.append(series)
-        df = pd.concat(columns, axis=1)
-        df['Time'] = pd.to_datetime(df[self._time_field], unit=self._time_unit)
-        df.set_index('Time', inplace=True)
-        del data, columns
-        df.sort_index(inplace=True)
-        return df
+        return prepare_dataframe(data, self._columns, time_field=self._time_field, time_unit=self._time_unit)
 
     def _update_cache(self, df):
         """
@@ -121,8 +121,7 @@ class TimeSeriesStore(BaseSQLStore):
         :return:
         """
         self._ensure_cache()
-        df = df.fillna(0)
-        indexed = {k.to_pydatetime().timestamp(): v for k, v in df.to_dict(orient='index').items()}
+        indexed = self._to_indexed(df)
 
         self._local_cache.update(indexed)
         current_time = datetime.utcnow()
@@ -131,9 +130,73 @@ class TimeSeriesStore(BaseSQLStore):
         del df
         return None
 
+    def _to_indexed(self, df):
+        """
+        Returns {timestamp: row} dict in the format kept in the store
+        :param df:
+        :return:
+        """
+        df = df.fillna(0)
+        return {k.to_pydatetime().timestamp(): v for k, v in df.to_dict(orient='index').items()}
+
     def _ensure_cache(self):
         if self._local_cache is None:
-            self._local_cache = self._get_initial_store()
+            if self._storage == STORAGE.ROWS:
+                # Row storage only keeps rows that have not been flushed yet
+                self._ensure_rows_table()
+                self._local_cache = {}
+            else:
+                self._local_cache = self._get_initial_store()
+
+    def _ensure_rows_table(self):
+        if not self._rows_connected:
+            if not self._table_exists(self._rows_name):
+                self._init_table(name=self._rows_name, table_format=datastore_rows, primary_key='timestamp')
+            self._rows_connected = True
+
+    def _load_rows(self, start=None, end=None, limit=None):
+        """
+        Returns {timestamp: row} dict read from the row table
+        :param start: lower UNIX timestamp bound, inclusive
+        :param end: upper UNIX timestamp bound, inclusive
+        :param limit: only return the latest `limit` rows
+        :return:
+        """
+        self._ensure_rows_table()
+        if self._offline:
+            rows = sorted(
+                ((k, v) for k, v in memory_table(self._rows_name).items()
+                 if (start is None or k >= start) and (end is None or k <= end)),
+                reverse=True
+            )
+            return dict(rows[:limit])
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append("timestamp >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp <= %s")
+            params.append(end)
+        command = """
+        select timestamp, data from public.{name}
+        {where}
+        order by timestamp desc
+        {limit}
+        ;
+        """.format(
+            name=self._rows_name,
+            where="WHERE " + " AND ".join(conditions) if conditions else "",
+            limit="limit {}".format(int(limit)) if limit is not None else ""
+        )
+        with self._connection() as connection:
+            cur = connection.cursor()
+            try:
+                cur.execute(command, params)
+                res = cur.fetchall()
+            finally:
+                cur.close()
+        return {x[0]: x[1] for x in res}
 
     def _remote_to_df(self, data):
         res = {}
@@ -166,27 +229,72 @@ class TimeSeriesStore(BaseSQLStore):
         return {spec: row for row, spec in zip(data, self._table_spec)}
 
     def _perform_persist(self):
+        if self._storage == STORAGE.ROWS:
+            return self._perform_rows_persist()
         if not self._table_connected:
             self._connect_table()
-        connection = self._ensure_connection()
         self._ensure_cache()
-        cur = connection.cursor()
         command = """
-        UPDATE public.{name} SET data=(%s) WHERE id=(%s)
+        UPDATE public.{name} SET data=(%s), metadata=(%s) WHERE id=(%s)
         """.format(name=self.name)
         data = Json(self._local_cache)
-        try:
-            cur.execute(command, (data, self._current_trunk_id))
-            connection.commit()
-            self._last_updated = datetime.utcnow()
-        except BaseException as e:
-            print("[error] Cache flush failed!")
-        finally:
-            cur.close()
+        metadata = Json(self._trunk_catalog())
+        with self._connection() as connection:
+            cur = connection.cursor()
+            try:
+                cur.execute(command, (data, metadata, self._current_trunk_id))
+                connection.commit()
+                self._last_updated = datetime.utcnow()
+            except BaseException as e:
+                print("[error] Cache flush failed!")
+            finally:
+                cur.close()
         if self._need_new_trunk():
             self._start_new_trunk({})
             self._local_cache = {}
 
+    def _trunk_catalog(self):
+        """
+        Returns min/max time of the trunk, used by readers to select trunks for a time window
+        :return:
+        """
+        timestamps = [float(x) for x in self._local_cache.keys()]
+        if len(timestamps) == 0:
+            return {}
+        return dict(min_time=min(timestamps), max_time=max(timestamps))
+
+    def _perform_rows_persist(self):
+        """
+        Appends rows collected since the last flush to the row table, so flush cost does not depend on stored history
+        :return:
+        """
+        self._ensure_cache()
+        current_time = datetime.utcnow()
+        if len(self._local_cache) == 0:
+            self._last_updated = current_time
+            return None
+        if self._offline:
+            memory_table(self._rows_name).update(self._local_cache)
+            self._local_cache = {}
+            self._last_updated = current_time
+            return None
+        command = """
+        insert into public.{name} (timestamp, created_at, data) values %s
+        ON CONFLICT (timestamp) DO UPDATE SET created_at=EXCLUDED.created_at, data=EXCLUDED.data;
+        """.format(name=self._rows_name)
+        rows = [(timestamp, current_time, Json(item)) for timestamp, item in self._local_cache.items()]
+        with self._connection() as connection:
+            cur = connection.cursor()
+            try:
+                execute_values(cur, command, rows)
+                connection.commit()
+                self._local_cache = {}
+                self._last_updated = current_time
+            except BaseException as e:
+                print("[error] Row append failed!")
+            finally:
+                cur.close()
+
     def _need_new_trunk(self):
         if type(self._new_row_policy) is int:
             if getsizeof(self._local_cache) > self._new_row_policy:
@@ -1,5 +1,6 @@
 from math import floor
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
 import dateutil
 from models.algorithm import BaseAlgorithm
@@ -8,10 +9,11 @@ from models.exchange import BaseExchangeInterface
 from models.trade import Trade
 from models.signal import Signal
 from models.arbitrageplotter import ArbitragePlotter
+from objects.buffers import ColumnBuffer, RollingFrame
 from persistence.simple_store import InMemoryStore
 from persistence.mixins import PrepareDataMixin, WithConsole
 from parsers.rates import orderbook_to_series
-from constants.formats import orderbook_format, signal_format
+from constants.formats import history_format, orderbook_format, signal_format, signal_history_format
 from constants.constants import DECISIONS
 from logger.hdf_logger import hdf_log
 from logger.visual_logger import VisualLogger
@@ -22,19 +24,29 @@ class LiveTrader(WithConsole, PrepareDataMixin, InMemoryStore):
     current_status = DECISIONS.NO_DATA
     current_trade = None
     current_equity = 250
+    history_capacity = 100000
 
     def __init__(self, *args, **kwargs):
+        self._signal_spill = kwargs.pop('signal_spill', None)
+        self._trade_spill = kwargs.pop('trade_spill', None)
         super().__init__(*args, **kwargs)
-        self.trade_history = []
-        self.signal_history = []
+        self.trade_history = ColumnBuffer(
+            Trade._fields,
+            dtypes=dict(volume='f8', profit='f8', open_price='f8', close_price='f8'),
+            capacity=self.history_capacity,
+            spill=self._trade_spill,
+            record_type=Trade
+        )
+        self.signal_history = self._signal_buffer()
         self.algorithm: BaseAlgorithm = None
         self.simulator: BaseSimulator = None
         self._trade_api = None
         self._source_api = None
         self._target_api = None
-        self._source_df = None
-        self._orderbook = None
+        self._source_buffer = RollingFrame(history_format)
+        self._orderbook_buffer = RollingFrame(orderbook_format)
         self._target_trades = None
+        self._market = None
         self._cutoff = timedelta(hours=24)
         self._emulate_signals = False
         self._logger = VisualLogger()
@@ -71,7 +83,7 @@ class LiveTrader(WithConsole, PrepareDataMixin, InMemoryStore):
         self._emulate_signals = status
 
     def simulate(self, preprocessor=None, **kwargs):
-        self.signal_history = []
+        self.signal_history = self._signal_buffer()
         dfs = {}
         for name, filename in kwargs.items():
             df = pd.DataFrame.from_csv(filename)
@@ -85,10 +97,88 @@ class LiveTrader(WithConsole, PrepareDataMixin, InMemoryStore):
             # x['normalized_source'].iloc[-1]['timestamp'] > 1533971375
             for k, df in x.items():
                 self.log("{}: {}\n".format(k, len(df)))
-        print(self.signal_history)
+        print(self.signal_history.to_frame())
+        self._refresh_plots(**dfs)
+
+    def backtest(self, **kwargs):
+        """
+        Replays dataframes saved to csv files as a stream of events: every simulator tick passes only the trades
+        and order book snapshots that arrived since the previous tick, and the algorithm keeps its own state
+        :param kwargs: {'original_source': filename, 'original_orderbook': filename}
+        :return:
+        """
+        dfs = {name: pd.DataFrame.from_csv(filename) for name, filename in kwargs.items()}
+        self.replay(dfs)
+        self.log("Backtest finished: {} signals, {} trades\n".format(len(self.signal_history), len(self.trade_history)))
+        self._refresh_plots(**dfs)
+        return self.signal_history
+
+    def replay(self, dfs, start=None, end=None):
+        """
+        Feeds dataframes to the algorithm tick by tick through simulator events
+        :param dfs: {'original_source': trades dataframe, 'original_orderbook': order book dataframe}
+        :param start: ticks up to this datetime only warm up the algorithm, nothing is executed or recorded
+        :param end: replay stops after this datetime
+        :return:
+        """
+        self.signal_history = self._signal_buffer()
+        self._market = None
+        for name, df in dfs.items():
+            self.simulator.add_dataframe(df, name)
+        for current_time, events in self.simulator.events(until=end):
+            if end is not None and current_time > end:
+                break
+            self.event_callback(events, current_time, execute=start is None or current_time > start)
+        return self.signal_history
+
+    def event_callback(self, events, current_time, execute=True):
+        """
+        Processes one backtest tick
+        :param events: {'original_source': new trades, 'original_orderbook': new order book snapshots}
+        :param current_time:
+        :param execute: execute and record the signal, otherwise only update the algorithm state
+        :return:
+        """
+        source = events.get('original_source')
+        orderbook = events.get('original_orderbook')
+        if self._emulate_signals and source is not None:
+            source, orderbook = self.algorithm.emulate(source.copy(), orderbook)
+
+        signal_object: Signal = self.algorithm.on_events(source, orderbook, current_time)
+
+        if orderbook is not None and len(orderbook) > 0:
+            timestamps = orderbook['timestamp'].values
+            known = np.flatnonzero(~np.isnan(timestamps.astype(np.float64)))
+            if len(known) > 0:
+                self._market = orderbook.iloc[known[-1:]]
+        cutoff_timestamp = int(current_time.timestamp()) - self._get_cutoff().seconds
+        if self._market is not None and self._market['timestamp'].iloc[0] < cutoff_timestamp:
+            self._market = None
+        if not execute:
+            return DECISIONS.NO_DATA
+        result = self._execute_signal(signal_object, orderbook=self._market, current_time=current_time)
+
+        historical_signal = signal_object._asdict()
+        historical_signal['result'] = result
+        historical_signal['logged_time'] = current_time
+        self.signal_history.append(historical_signal)
+        return result
+
+    def _signal_buffer(self):
+        """
+        Returns an empty signal history keeping the latest `history_capacity` signals, older ones go to the spill file
+        """
+        return ColumnBuffer(
+            signal_history_format,
+            dtypes=dict(buy='f8', sell='f8'),
+            capacity=self.history_capacity,
+            spill=self._signal_spill
+        )
+
+    def _refresh_plots(self, **dfs):
         if self._plotter is not None:
             self._plotter.refresh(**dfs)
-            signal_chart = pd.DataFrame.from_records(self.signal_history, columns=signal_format)
+            signal_chart = self.signal_history.to_frame(signal_format)
             signal_chart['Time'] = signal_chart['buy_datetime']
             signal_chart.set_index('Time', inplace=True)
             self._plotter.refresh_indicator(INDICATOR_NAMES.WEIGTHED, signal_chart, col='buy')
@@ -132,36 +222,30 @@ class LiveTrader(WithConsole, PrepareDataMixin, InMemoryStore):
                 self.algorithm.emulate(data_dict['original_source'], data_dict['original_orderbook'])
 
         if source == "live":
-            data_dict['original_source'] = pd.concat(
-                [self._source_df, data_dict['original_source']]
-            ).drop_duplicates(keep='last', subset='timestamp')
-            data_dict['original_source'].drop(
-                data_dict['original_source'].index[data_dict['original_source']['timestamp'] < cutoff_timestamp],
-                inplace=True
+            for buffer, df in ((self._source_buffer, data_dict['original_source']),
+                               (self._orderbook_buffer, data_dict['original_orderbook'])):
+                buffer.merge(df)
+                buffer.evict(cutoff_timestamp)
+            # The algorithm keeps its own window, only fetched rows are passed to it
+            signal_object: Signal = self.algorithm.on_events(
+                data_dict['original_source'], data_dict['original_orderbook'], current_time
             )
-
-            data_dict['original_orderbook'] = pd.concat(
-                [self._orderbook, data_dict['original_orderbook']]
-            ).drop_duplicates(keep='last', subset='timestamp')
-            data_dict['original_orderbook'].drop(
-                data_dict['original_orderbook'].index[data_dict['original_orderbook']['timestamp'] < cutoff_timestamp],
-                inplace=True
+            result = self._execute_signal(
+                signal_object, orderbook=self._orderbook_buffer.tail(1), current_time=current_time
             )
-
-        true_source = None
-        true_orderbook = None
-        if 'normalized_source' in data_dict:
-            true_source = self._perform_cutoff(data_dict['normalized_source'], cutoff_timestamp)
         else:
-            true_source = self._perform_cutoff(data_dict['original_source'], cutoff_timestamp)
-        if 'normalized_source' in data_dict:
-            true_orderbook = self._perform_cutoff(data_dict['normalized_orderbook'], cutoff_timestamp)
-        else:
-            true_orderbook = self._perform_cutoff(data_dict['original_orderbook'], cutoff_timestamp)
+            if 'normalized_source' in data_dict:
+                true_source = self._perform_cutoff(data_dict['normalized_source'], cutoff_timestamp)
+            else:
+                true_source = self._perform_cutoff(data_dict['original_source'], cutoff_timestamp)
+            if 'normalized_source' in data_dict:
+                true_orderbook = self._perform_cutoff(data_dict['normalized_orderbook'], cutoff_timestamp)
+            else:
+                true_orderbook = self._perform_cutoff(data_dict['original_orderbook'], cutoff_timestamp)
 
-        # Apply algorithm from analyzer
-        signal_object: Signal = self.algorithm.signal(true_source, true_orderbook, preprocessor, current_time)
-        result = self._execute_signal(signal_object, orderbook=true_orderbook, current_time=current_time)
+            # Apply algorithm from analyzer
+            signal_object: Signal = self.algorithm.signal(true_source, true_orderbook, preprocessor, current_time)
+            result = self._execute_signal(signal_object, orderbook=true_orderbook, current_time=current_time)
 
         historical_signal = signal_object._asdict()
         historical_signal['result'] = result
@@ -171,16 +255,10 @@ class LiveTrader(WithConsole, PrepareDataMixin, InMemoryStore):
         # add logging of important stuff
         if result != DECISIONS.NO_DATA or self._logger.timeout():
             self.log(str(signal_object))
-            if self._plotter is not None:
-                self._plotter.refresh(original_source=true_source, original_orderbook=true_orderbook)
-                signal_chart = pd.DataFrame.from_records(self.signal_history, columns=signal_format)
-                signal_chart['Time'] = signal_chart['buy_datetime']
-                signal_chart.set_index('Time', inplace=True)
-                self._plotter.refresh_indicator(INDICATOR_NAMES.WEIGTHED, signal_chart, col='buy')
-
-        if source == "live":
-            self._source_df = data_dict['original_source']
-            self._orderbook = data_dict['original_orderbook']
+            if source == "live":
+                true_source = self._source_buffer.to_frame()
+                true_orderbook = self._orderbook_buffer.to_frame()
+            self._refresh_plots(original_source=true_source, original_orderbook=true_orderbook)
         return self.signal_history
 
     def _execute_signal(self, signal: Signal, orderbook=None, current_time=None):
@@ -191,8 +269,12 @@ class LiveTrader(WithConsole, PrepareDataMixin, InMemoryStore):
         """
         if current_time is None:
             current_time = datetime.utcnow().replace(tzinfo=dateutil.tz.tzutc())
+        if not (signal.decision == DECISIONS.BUY_ALL and self.current_status == DECISIONS.NO_DATA) and \
+                not (signal.decision == DECISIONS.SELL_ALL and self.current_status == DECISIONS.BUY_ALL):
+            # Nothing to execute, skip looking up the market
+            return DECISIONS.NO_DATA
         if orderbook is None:
-            orderbook = self._orderbook
+            orderbook = self._orderbook_buffer.tail(1)
         if orderbook is None or len(orderbook.dropna(subset=['timestamp'])) == 0:
             return DECISIONS.NO_DATA
         current_market = orderbook.dropna(subset=['timestamp']).iloc[-1]
@@ -0,0 +1,299 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnBuffer:
+    """
+    Records kept as column arrays. A bounded buffer is a ring holding the latest `capacity` records,
+    an unbounded one grows by doubling. Arrays of a bounded buffer also grow by doubling until the ring fills up,
+    so memory follows the number of records. Appends are amortized O(1) and tails are views of the arrays.
+    Records about to be overwritten in a ring can be spilled to a csv file.
+    """
+
+    def __init__(self, columns, dtypes=None, capacity=None, spill=None, record_type=None, initial_size=1024):
+        """
+        :param columns: column names
+        :param dtypes: {column: numpy dtype}, object for columns absent from it
+        :param capacity: number of latest records kept, unbounded if None
+        :param spill: csv filename receiving records before a ring overwrites them
+        :param record_type: namedtuple class records are returned as when iterating, dicts if None
+        :param initial_size: initial length of the arrays
+        """
+        dtypes = dtypes or {}
+        self.columns = list(columns)
+        self.capacity = capacity
+        self._dtypes = {column: np.dtype(dtypes.get(column, object)) for column in self.columns}
+        self._spill = spill
+        self._record_type = record_type
+        self._size = min(initial_size, capacity) if capacity is not None else initial_size
+        self._arrays = {column: self._empty(column, self._size) for column in self.columns}
+        self._count = 0
+        self._spilled = 0
+
+    def __len__(self):
+        if self.capacity is None:
+            return self._count
+        return min(self._count, self.capacity)
+
+    def __iter__(self):
+        columns = self.view()
+        for values in zip(*(columns[column] for column in self.columns)):
+            if self._record_type is not None:
+                yield self._record_type(*values)
+            else:
+                yield dict(zip(self.columns, values))
+
+    @property
+    def total(self):
+        """
+        Number of records appended since the buffer was created or cleared, including evicted ones
+        """
+        return self._count
+
+    def append(self, record):
+        """
+        Appends a dict or a namedtuple, missing columns are stored as None or NaN
+        :param record:
+        :return:
+        """
+        if hasattr(record, '_asdict'):
+            record = record._asdict()
+        if self.capacity is None or self._count < self.capacity:
+            if self._count == self._size:
+                self._grow(self._size * 2)
+            positions = (self._count,)
+        else:
+            if self._spill is not None and self._count - self._spilled == self.capacity:
+                self._spill_oldest(max(1, self.capacity // 2))
+            if self._count == self.capacity:
+                self._start_ring()
+            slot = self._count % self.capacity
+            positions = (slot, slot + self.capacity)
+        for column in self.columns:
+            value = record.get(column)
+            if value is None and self._dtypes[column].kind == 'f':
+                value = np.nan
+            array = self._arrays[column]
+            for position in positions:
+                array[position] = value
+        self._count += 1
+
+    def view(self, n=None):
+        """
+        Returns {column: array view} of the latest n records, all kept records if n is None
+        :param n:
+        :return:
+        """
+        length = len(self)
+        n = length if n is None else max(0, min(n, length))
+        if self.capacity is None or self._count <= self.capacity:
+            end = self._count
+        else:
+            end = (self._count - 1) % self.capacity + self.capacity + 1
+        return {column: self._arrays[column][end - n:end] for column in self.columns}
+
+    def tail(self, n=None, columns=None):
+        """
+        Returns dataframe of the latest n records, all kept records if n is None
+        :param n:
+        :param columns: subset of columns
+        :return:
+        """
+        view = self.view(n)
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({column: view[column] for column in columns}, columns=columns)
+
+    def to_frame(self, columns=None):
+        return self.tail(None, columns)
+
+    def flush(self):
+        """
+        Spills kept records not spilled yet
+        :return:
+        """
+        if self._spill is not None and self._count > self._spilled:
+            self._spill_oldest(self._count - self._spilled)
+
+    def clear(self):
+        self._count = 0
+        self._spilled = 0
+
+    def _empty(self, column, size):
+        dtype = self._dtypes[column]
+        if dtype.kind == 'f':
+            return np.full(size, np.nan, dtype=dtype)
+        return np.empty(size, dtype=dtype)
+
+    def _grow(self, size):
+        if self.capacity is not None:
+            size = min(size, self.capacity)
+        for column in self.columns:
+            array = self._empty(column, size)
+            array[:self._count] = self._arrays[column][:self._count]
+            self._arrays[column] = array
+        self._size = size
+
+    def _start_ring(self):
+        # A ring writes every record twice, at its slot and `capacity` further, so any tail is contiguous
+        size = self.capacity * 2
+        for column in self.columns:
+            array = self._empty(column, size)
+            array[:self.capacity] = self._arrays[column][:self.capacity]
+            array[self.capacity:] = self._arrays[column][:self.capacity]
+            self._arrays[column] = array
+        self._size = size
+
+    def _spill_oldest(self, count):
+        start = self._spilled % self.capacity if self.capacity is not None else self._spilled
+        block = pd.DataFrame(
+            {column: self._arrays[column][start:start + count] for column in self.columns},
+            columns=self.columns
+        )
+        header = not os.path.exists(self._spill)
+        block.to_csv(self._spill, mode='a', header=header, index=False)
+        self._spilled += count
+
+
+class RollingFrame:
+    """
+    Time ordered rows kept as column arrays between a front and a back cursor. Merged rows replace rows with the
+    same time field value in place or are appended, expired rows are evicted by moving the front cursor, and the
+    arrays are compacted or grown only when the back cursor reaches their end, so both are amortized O(1) per row.
+    Rows older than the latest one and not seen before are inserted at their place, which is O(length).
+    """
+
+    def __init__(self, columns, time_field='timestamp', initial_size=1024):
+        """
+        :param columns: column names
+        :param time_field: numeric column rows are ordered, merged and evicted by
+        :param initial_size: initial length of the arrays
+        """
+        self.columns = list(columns)
+        self.time_field = time_field
+        self._size = initial_size
+        self._arrays = None
+        self._index = None
+        self._tz = None
+        self._positions = {}
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def latest(self):
+        if len(self) == 0:
+            return None
+        return self._arrays[self.time_field][self._end - 1]
+
+    def merge(self, df):
+        """
+        Merges rows of a dataframe indexed by Time, the last of rows sharing a time field value wins
+        :param df:
+        :return: number of rows added or replaced
+        """
+        if df is None or len(df) == 0:
+            return 0
+        if self._arrays is None:
+            self._allocate(df)
+        columns = [df[column].values if column in df.columns else None for column in self.columns]
+        index = df.index.values
+        times = df[self.time_field].values.astype(np.float64)
+        merged = 0
+        for row in range(len(df)):
+            timestamp = times[row]
+            if np.isnan(timestamp):
+                continue
+            position = self._positions.get(timestamp)
+            if position is None:
+                if len(self) > 0 and timestamp < self.latest:
+                    position = self._insert(timestamp)
+                else:
+                    position = self._append(timestamp)
+            for column, values in zip(self.columns, columns):
+                self._arrays[column][position] = values[row] if values is not None else None
+            self._index[position] = index[row]
+            merged += 1
+        return merged
+
+    def evict(self, cutoff):
+        """
+        Removes rows with time field value below cutoff
+        :param cutoff:
+        :return:
+        """
+        times = self._arrays[self.time_field] if self._arrays is not None else None
+        while self._start < self._end and times[self._start] < cutoff:
+            del self._positions[times[self._start]]
+            self._start += 1
+
+    def tail(self, n=None):
+        """
+        Returns dataframe indexed by Time of the latest n rows, all rows if n is None
+        :param n:
+        :return:
+        """
+        if self._arrays is None:
+            return pd.DataFrame(columns=self.columns)
+        start = self._start if n is None else max(self._start, self._end - n)
+        index = pd.DatetimeIndex(self._index[start:self._end], name='Time')
+        if self._tz is not None:
+            index = index.tz_localize('UTC').tz_convert(self._tz)
+        return pd.DataFrame(
+            {column: self._arrays[column][start:self._end] for column in self.columns},
+            index=index,
+            columns=self.columns
+        )
+
+    def to_frame(self):
+        return self.tail()
+
+    def _allocate(self, df):
+        self._arrays = {}
+        for column in self.columns:
+            numeric = column in df.columns and np.issubdtype(df[column].dtype, np.number)
+            self._arrays[column] = np.empty(self._size, dtype=np.float64 if numeric else object)
+        self._arrays[self.time_field] = self._arrays[self.time_field].astype(np.float64)
+        self._index = np.empty(self._size, dtype='datetime64[ns]')
+        self._tz = getattr(df.index, 'tz', None)
+
+    def _append(self, timestamp):
+        if self._end == self._size:
+            self._make_room()
+        position = self._end
+        self._end += 1
+        self._arrays[self.time_field][position] = timestamp
+        self._positions[timestamp] = position
+        return position
+
+    def _insert(self, timestamp):
+        if self._end == self._size:
+            self._make_room()
+        times = self._arrays[self.time_field]
+        position = self._start + int(np.searchsorted(times[self._start:self._end], timestamp))
+        for array in list(self._arrays.values()) + [self._index]:
+            array[position + 1:self._end + 1] = array[position:self._end].copy()
+        self._end += 1
+        times[position] = timestamp
+        for moved in range(position, self._end):
+            self._positions[times[moved]] = moved
+        return position
+
+    def _make_room(self):
+        length = len(self)
+        if self._start < self._size // 2:
+            self._size *= 2
+        for name, array in list(self._arrays.items()) + [(None, self._index)]:
+            resized = np.empty(self._size, dtype=array.dtype)
+            resized[:length] = array[self._start:self._end]
+            if name is None:
+                self._index = resized
+            else:
+                self._arrays[name] = resized
+        times = self._arrays[self.time_field]
+        self._positions = {times[position]: position for position in range(length)}
+        self._start = 0
+        self._end = length
@@ -1,7 +1,71 @@
+from collections import OrderedDict
+
 import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+SUM_COLUMNS = ('volume',)
+
+_AGGREGATION_PLANS = {}
+
 
 def create_empty_dataframe(columns):
     _df = pd.DataFrame(columns=columns)
     _df['Time'] = pd.to_datetime(_df.created_at)
     _df.set_index('Time', inplace=True)
-    return _df
\ No newline at end of file
+    return _df
+
+
+def _aggregation_plan(df, columns, time_field):
+    """
+    Returns cached {column: aggregation} plan for the column spec and dtypes of df:
+    sum for volumes, mean for other numeric columns, first for the rest
+    """
+    key = (tuple(columns), time_field, tuple(str(x) for x in df.dtypes))
+    plan = _AGGREGATION_PLANS.get(key)
+    if plan is None:
+        plan = OrderedDict()
+        for column in columns:
+            if column == time_field:
+                continue
+            if not is_numeric_dtype(df[column]):
+                plan[column] = 'first'
+            elif column in SUM_COLUMNS:
+                plan[column] = 'sum'
+            else:
+                plan[column] = 'mean'
+        _AGGREGATION_PLANS[key] = plan
+    return plan
+
+
+def prepare_dataframe(data, columns, time_field='time', time_unit='s'):
+    """
+    Returns a unique-key dataframe indexed by Time, aggregating rows sharing the same time_field value
+    :param data: records, a DataFrame or a single Series
+    :param columns: column spec
+    :param time_field: column holding the time key
+    :param time_unit: unit of the time key
+    :return:
+    """
+    if isinstance(data, pd.Series):
+        data = [data]
+    df = pd.DataFrame(data, columns=columns)
+    if df[time_field].isnull().any():
+        df = df.dropna(subset=[time_field])
+    plan = _aggregation_plan(df, columns, time_field)
+    ordered = df[time_field].is_monotonic_increasing
+    if df[time_field].is_unique:
+        # Nothing to aggregate, only normalize values the way aggregation would
+        numeric = {column: 'float64' for column, how in plan.items() if how != 'first'}
+        df = df.astype(numeric)
+        for column, how in plan.items():
+            if how == 'sum':
+                df[column] = df[column].fillna(0)
+    else:
+        df = df.groupby(time_field, sort=not ordered).agg(plan)
+        df[time_field] = df.index
+        df = df[columns]
+    df['Time'] = pd.to_datetime(df[time_field], unit=time_unit)
+    df.set_index('Time', inplace=True)
+    if not ordered:
+        df.sort_index(inplace=True)
+    return df
@@ -1,4 +1,5 @@
 from datetime import timedelta, datetime
+import numpy as np
 import pandas as pd
 import dateutil
 from dateutil import parser
@@ -28,29 +29,67 @@ def get_rate(source_rate: pd.DataFrame, target_orderbook: pd.DataFrame, start=ti
     target_mean = (target_frame['ask'].mean() + target_frame['bid'].mean()) / 2
     return source_mean / target_mean
 
-def orderbook_to_record(orderbook, coeff=1.0):
+def _levels(levels):
+    """
+    Returns (prices, volumes) arrays of order book levels, parsing every level once
+    """
+    prices = np.array([x['price'] for x in levels], dtype=np.float64)
+    volumes = np.array([x['remaining_volume'] for x in levels], dtype=np.float64)
+    return prices, volumes
+
+
+def _depth_features(res, side, prices, volumes, depth, vwap_sizes):
+    """
+    Adds volume of the best `depth` levels and average price of filling `vwap_sizes` volumes to res
+    :param prices: level prices sorted from the best
+    :param volumes: level volumes in the same order
+    """
+    cumulative = np.cumsum(volumes)
+    for n in depth:
+        res['{}_depth_{}'.format(side, n)] = cumulative[min(n, len(cumulative)) - 1]
+    if len(vwap_sizes) == 0:
+        return
+    cost = np.cumsum(prices * volumes)
+    for size in vwap_sizes:
+        level = int(np.searchsorted(cumulative, size))
+        if level == len(cumulative):
+            # Not enough volume in the book
+            res['{}_vwap_{}'.format(side, size)] = np.nan
+            continue
+        filled = cumulative[level - 1] if level > 0 else 0.0
+        spent = cost[level - 1] if level > 0 else 0.0
+        res['{}_vwap_{}'.format(side, size)] = (spent + prices[level] * (size - filled)) / size
+
+
+def orderbook_to_record(orderbook, coeff=1.0, depth=(), vwap_sizes=()):
+    """
+    Returns best prices, total volumes and volume weighted distances from the best price of both book sides
+    :param orderbook: {'asks': levels, 'bids': levels}
+    :param coeff: price multiplier
+    :param depth: numbers of best levels to add `ask_depth_N` and `bid_depth_N` volumes for
+    :param vwap_sizes: volumes to add `ask_vwap_S` and `bid_vwap_S` average fill prices for
+    :return:
+    """
     res = dict(timestamp=None, bid=0.0, ask=0.0, bid_volume=0.0, bid_weight=0.0, ask_volume=0.0, ask_weight=0.0)
     if len(orderbook['asks']) == 0 or len(orderbook['bids']) == 0:
         return res
     try:
-        res['ask'] = min([float(x['price']) for x in orderbook['asks']]) * coeff
-        res['bid'] = max([float(x['price']) for x in orderbook['bids']]) * coeff
-
-        volume = 0
-        weight = 0
-        for el in orderbook['asks']:
-            volume += float(el['remaining_volume'])
-            weight += float(el['remaining_volume']) * (res['ask'] - float(el['price']) * coeff)
-        res['ask_volume'] = volume
-        res['ask_weight'] = weight
-
-        volume = 0
-        weight = 0
-        for el in orderbook['bids']:
-            volume += float(el['remaining_volume'])
-            weight += float(el['remaining_volume']) * (float(el['price']) - res['bid'] * coeff)
-        res['bid_volume'] = volume
-        res['bid_weight'] = weight
+        ask_prices, ask_volumes = _levels(orderbook['asks'])
+        bid_prices, bid_volumes = _levels(orderbook['bids'])
+        ask_prices *= coeff
+        res['ask'] = ask_prices.min()
+        res['bid'] = bid_prices.max() * coeff
+
+        res['ask_volume'] = ask_volumes.sum()
+        res['ask_weight'] = (ask_volumes * (res['ask'] - ask_prices)).sum()
+        res['bid_volume'] = bid_volumes.sum()
+        res['bid_weight'] = (bid_volumes * (bid_prices - res['bid'] * coeff)).sum()
+
+        if len(depth) > 0 or len(vwap_sizes) > 0:
+            order = np.argsort(ask_prices, kind='mergesort')
+            _depth_features(res, 'ask', ask_prices[order], ask_volumes[order], depth, vwap_sizes)
+            order = np.argsort(-bid_prices, kind='mergesort')
+            _depth_features(res, 'bid', bid_prices[order] * coeff, bid_volumes[order], depth, vwap_sizes)
 
         res['timestamp'] = int(datetime.utcnow().replace(tzinfo=dateutil.tz.tzutc()).timestamp())
         return res
@@ -0,0 +1,211 @@
+import io
+import json
+import struct
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from models.timeseries import TimeSeriesStore
+from constants.constants import STORAGE
+from persistence.simple_store import memory_table
+
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+POSTGRES_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+JSONB_VERSION = b'\x01'
+
+
+def _to_postgres_time(value):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - POSTGRES_EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def encode_rows(rows, created_at):
+    """
+    Returns binary COPY stream of (timestamp, created_at, data) tuples in the row table layout
+    :param rows: iterable of (timestamp, data) pairs
+    :param created_at: datetime stamped on every row
+    :return:
+    """
+    buffer = io.BytesIO()
+    buffer.write(COPY_SIGNATURE)
+    buffer.write(struct.pack('>ii', 0, 0))
+    created_at = struct.pack('>iq', 8, _to_postgres_time(created_at))
+    for timestamp, data in rows:
+        payload = JSONB_VERSION + json.dumps(data).encode()
+        buffer.write(struct.pack('>hid', 3, 8, timestamp))
+        buffer.write(created_at)
+        buffer.write(struct.pack('>i', len(payload)))
+        buffer.write(payload)
+    buffer.write(struct.pack('>h', -1))
+    buffer.seek(0)
+    return buffer
+
+
+def decode_rows(data):
+    """
+    Returns {timestamp: data} dict from binary COPY stream of (timestamp, data) tuples
+    :param data: bytes
+    :return:
+    """
+    if not data.startswith(COPY_SIGNATURE):
+        raise ValueError('Not a binary COPY stream')
+    offset = len(COPY_SIGNATURE)
+    _, extension_length = struct.unpack_from('>ii', data, offset)
+    offset += 8 + extension_length
+    rows = {}
+    while True:
+        count, = struct.unpack_from('>h', data, offset)
+        offset += 2
+        if count == -1:
+            break
+        fields = []
+        for _ in range(count):
+            length, = struct.unpack_from('>i', data, offset)
+            offset += 4
+            if length == -1:
+                fields.append(None)
+                continue
+            fields.append(data[offset:offset + length])
+            offset += length
+        timestamp, = struct.unpack('>d', fields[0])
+        rows[timestamp] = json.loads(fields[1][len(JSONB_VERSION):].decode())
+    return rows
+
+
+class BulkCopier(TimeSeriesStore):
+    """
+    Streams DataFrames in and out of a store with binary COPY, one chunk at a time.
+    Imports go to the row table, exports read both legacy trunks and the row table.
+    """
+
+    def __init__(self, name, columns, chunksize=50000, **kw):
+        kw['storage'] = STORAGE.ROWS
+        super().__init__(name, columns, **kw)
+        self._chunksize = chunksize
+
+    def import_df(self, data):
+        """
+        Writes dataframes indexed by Time into the row table, replacing rows with the same timestamp
+        :param data: DataFrame or an iterable of DataFrames
+        :return: number of rows written
+        """
+        if isinstance(data, pd.DataFrame):
+            data = [data]
+        total = 0
+        for df in data:
+            for position in range(0, len(df), self._chunksize):
+                total += self._copy_in(df.iloc[position:position + self._chunksize])
+        return total
+
+    def export_df(self, start=None, end=None):
+        """
+        Yields dataframes of at most `chunksize` rows between `start` and `end` UNIX timestamps
+        :param start:
+        :param end:
+        :return:
+        """
+        if self._offline:
+            df = self._internal_to_df(self._load_rows(start, end)).sort_index()
+            for position in range(0, len(df), self._chunksize):
+                yield df.iloc[position:position + self._chunksize]
+            return
+        if self._table_connected or self._connect_table(init=False):
+            for chunk in self._export_trunks(start, end):
+                yield chunk
+        for chunk in self._export_rows(start, end):
+            yield chunk
+
+    def _copy_in(self, df):
+        self._ensure_rows_table()
+        if self._offline:
+            rows = self._to_indexed(df)
+            memory_table(self._rows_name).update(rows)
+            return len(rows)
+        rows = self._to_indexed(df)
+        create = """
+        CREATE TEMP TABLE {name}_staging (LIKE public.{name}) ON COMMIT DROP;
+        """.format(name=self._rows_name)
+        copy = """
+        COPY {name}_staging (timestamp, created_at, data) FROM STDIN WITH (FORMAT binary)
+        """.format(name=self._rows_name)
+        merge = """
+        insert into public.{name} (timestamp, created_at, data)
+        select timestamp, created_at, data from {name}_staging
+        ON CONFLICT (timestamp) DO UPDATE SET created_at=EXCLUDED.created_at, data=EXCLUDED.data;
+        """.format(name=self._rows_name)
+        with self._connection() as connection:
+            cur = connection.cursor()
+            try:
+                cur.execute(create)
+                cur.copy_expert(copy, encode_rows(rows.items(), datetime.utcnow()))
+                cur.execute(merge)
+                connection.commit()
+                count = len(rows)
+            except BaseException as e:
+                connection.rollback()
+                print("[error] Bulk import failed!")
+                count = 0
+            finally:
+                cur.close()
+        return count
+
+    def _copy_out(self, query, params):
+        buffer = io.BytesIO()
+        with self._connection() as connection:
+            cur = connection.cursor()
+            try:
+                query = cur.mogrify(query, params).decode()
+                cur.copy_expert("COPY ({query}) TO STDOUT WITH (FORMAT binary)".format(query=query), buffer)
+            finally:
+                cur.close()
+        return decode_rows(buffer.getvalue())
+
+    def _time_conditions(self, column, start, end):
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append("{} >= %s".format(column))
+            params.append(start)
+        if end is not None:
+            conditions.append("{} <= %s".format(column))
+            params.append(end)
+        return "".join(" AND " + x for x in conditions), params
+
+    def _export_rows(self, start, end):
+        self._ensure_rows_table()
+        last_timestamp = float('-inf')
+        conditions, params = self._time_conditions('timestamp', start, end)
+        query = """
+        select timestamp, data from public.{name}
+        WHERE timestamp > %s{conditions}
+        order by timestamp
+        limit {limit}
+        """.format(name=self._rows_name, conditions=conditions, limit=int(self._chunksize))
+        while True:
+            rows = self._copy_out(query, [last_timestamp] + params)
+            if len(rows) == 0:
+                break
+            last_timestamp = max(rows.keys())
+            yield self._internal_to_df(rows).sort_index()
+
+    def _export_trunks(self, start, end):
+        with self._connection() as connection:
+            cur = connection.cursor()
+            try:
+                cur.execute("select id from public.{name} order by id;".format(name=self.name))
+                ids = [x[0] for x in cur.fetchall()]
+            finally:
+                cur.close()
+        conditions, params = self._time_conditions('entry.key::double precision', start, end)
+        query = """
+        select entry.key::double precision, entry.value from public.{name}
+        cross join lateral jsonb_each(data) entry
+        WHERE id = ANY(%s){conditions}
+        """.format(name=self.name, conditions=conditions)
+        step = max(1, self._chunksize // self._rows_per_trunk)
+        for position in range(0, len(ids), step):
+            rows = self._copy_out(query, [ids[position:position + step]] + params)
+            if len(rows) > 0:
+                yield self._internal_to_df(rows).sort_index()
@@ -1,5 +1,4 @@
-import pandas as pd
-from pandas.core.base import DataError
+from objects.dataframes import prepare_dataframe
 
 
 class WithConsole:
@@ -24,7 +23,6 @@ class PrepareDataMixin:
         self._time_unit = kwargs.pop('time_unit', None)
         super().__init__(*args, **kwargs)
 
-
     def _prepare_data(self, data, options=None):
         """
         Returns a cleaned up unique-key dataframe according to _columns spec
@@ -37,22 +35,4 @@ class PrepareDataMixin:
                 columns=getattr(self, '_columns', ['defaultcolumn']),
                 time_unit=getattr(self, '_time_unit', 's'),
             )
-        if isinstance(data, pd.Series):
-            data = [data]
-        df = pd.DataFrame(data, columns=options['columns']).groupby(options['time_field'])
-        columns = []
-        for column in options['columns']:
-            if column != 'volume':
-                try:
-                    series = df[column].mean()
-                except DataError as e:
-                    series = df[column].first()
-            else:
-                series = df[column].sum()
-            columns.append(series)
-        df = pd.concat(columns, axis=1)
-        df['Time'] = pd.to_datetime(df[options['time_field']], unit=options['time_unit'])
-        df.set_index('Time', inplace=True)
-        del data, columns
-        df.sort_index(inplace=True)
-        return df
+        return prepare_dataframe(data, **options)
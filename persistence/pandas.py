@@ -3,7 +3,7 @@ import dateutil.parser
 from psycopg2.extras import Json
 import pandas as pd
 from models.timeseries import TimeSeriesStore
-from objects.dataframes import create_empty_dataframe
+from constants.constants import STORAGE
 
 
 class PandasReader(TimeSeriesStore):
@@ -11,79 +11,88 @@ class PandasReader(TimeSeriesStore):
     def __init__(self, name, columns, **kw):
         super().__init__(name, columns, **kw)
         self._loaded_chunks = {}
-        self._segments_df = create_empty_dataframe(['created_at', 'id', 'loaded'])
         self._df = None
-        self._last_queried = None
 
     def read_latest(self, start=None, end=None, trunks=None):
+        """
+        Returns stored data between `start` and `end` hours before now. Time bounds are applied by the database,
+        so only rows inside the window are transferred.
+        :param start: hours before now
+        :param end: hours before now
+        :param trunks: load this many latest trunks instead of a time window
+        :return:
+        """
         if trunks:
             return self._load_latest_trunks(trunks)
 
-        connection = self._ensure_connection()
-        cur = connection.cursor()
-
         now = datetime.utcnow()
-        start = now - timedelta(hours=start)
-        end = now - timedelta(hours=end)
-
-        if self._last_queried is None or now - self._last_queried > timedelta(minutes=5):
-            self._refresh_segments(now, cur)
-
-        self._segments_df.sort_index(inplace=True)
-        segments_to_query = list(self._segments_df.loc[
-            (start <= self._segments_df.index)
-            & (self._segments_df.index <= end)
-            & (self._segments_df.loaded == False)
-                                 ]['id'].tolist())
-        print(segments_to_query)
-        # TODO: figure out which additional trunks to load
-        # TODO: 1) One previous trunk
-        try:
-            prev_segment = self._segments_df.loc[(self._segments_df.index < start)].iloc[-1]
-            if not prev_segment['loaded']:
-                prev_segment_id = int(prev_segment['id'])
-            else:
-                prev_segment_id = None
-        except:
-            prev_segment_id = None
-        if prev_segment_id is not None:
-            segments_to_query.append(prev_segment_id)
-        # TODO: 2) One latest trunk
-        if end == 0:
-            last_segment_id = self._get_last_trunk_id(cur)
-            if last_segment_id not in segments_to_query:
-                segments_to_query.append(last_segment_id)
-        if len(segments_to_query) > 0:
-            command = """
-            select * from public.{name}
-            WHERE id IN %s;
-            """.format(name=self.name)
-            cur.execute(command, (tuple(segments_to_query), ))
-            res = cur.fetchall()
-            res = [self._row(x) for x in res]
-            self._segments_df.loc[self._segments_df.id.isin(segments_to_query), 'loaded'] = True
-            return self._update_internal_df(self._remote_to_df(res))
-        else:
-            return self._df
-
+        start = (now - timedelta(hours=start)).timestamp()
+        end = (now - timedelta(hours=end)).timestamp()
+
+        data = {}
+        if self._trunks_available():
+            data.update(self._load_trunks_range(start, end))
+        if self._storage == STORAGE.ROWS:
+            data.update(self._load_rows(start=start, end=end))
+        if len(data) > 0:
+            self._df = self._internal_to_df(data).sort_index()
+        return self._df
 
-    def _refresh_segments(self, now, cur):
+    def _load_trunks_range(self, start, end):
+        """
+        Returns {timestamp: row} dict of trunk rows between `start` and `end` UNIX timestamps.
+        Trunks are picked by the min/max time catalog in their metadata, or by the span between their own and the
+        next trunk's creation time for trunks written before the catalog. Rows are filtered inside the database.
+        :param start:
+        :param end:
+        :return:
+        """
         command = """
-        select id, created_at from public.{name}
-        order by id desc 
-        ;
+        with spans as (
+            select id, metadata, created_at, lead(created_at) over (order by id) as closed_at
+            from public.{name}
+        )
+        select entry.key, entry.value from spans
+        join public.{name} trunk on trunk.id = spans.id
+        cross join lateral jsonb_each(trunk.data) entry
+        WHERE (
+            CASE WHEN spans.metadata ? 'min_time' THEN
+                (spans.metadata->>'min_time')::double precision <= %(end)s
+                AND (spans.metadata->>'max_time')::double precision >= %(start)s
+            ELSE
+                spans.created_at <= to_timestamp(%(end)s)
+                AND (spans.closed_at IS NULL OR spans.closed_at >= to_timestamp(%(start)s))
+            END
+        )
+        AND entry.key::double precision BETWEEN %(start)s AND %(end)s
+        order by spans.id;
         """.format(name=self.name)
-        cur.execute(command)
-        res = cur.fetchall()
-        data = {x[1]: dict(id=x[0], created_at=x[1], loaded=False) for x in res}
-        _df = pd.DataFrame.from_dict(data, orient='index')
-        _df['Time'] = _df.index
-        _df.set_index('Time', inplace=True)
-        self._segments_df = _df
-        self._last_queried = now
-        return _df
+        with self._connection() as connection:
+            cur = connection.cursor()
+            try:
+                cur.execute(command, dict(start=start, end=end))
+                res = cur.fetchall()
+            finally:
+                cur.close()
+        return {float(x[0]): x[1] for x in res}
+
+    def _trunks_available(self):
+        # The in-memory database keeps rows only
+        if self._offline:
+            return False
+        return self._table_connected or self._connect_table(init=False)
+
+    def _update_rows_df(self, start=None, end=None, limit=None):
+        rows = self._load_rows(start=start, end=end, limit=limit)
+        if len(rows) > 0:
+            self._update_internal_df(self._internal_to_df(rows))
+        return self._df
 
     def _load_latest_trunks(self, trunks):
+        if self._storage == STORAGE.ROWS:
+            self._update_rows_df(limit=trunks * self._rows_per_trunk)
+            if not self._trunks_available():
+                return self._df
         result = self._perform_limited_pure_load(trunks=trunks)
         self._loaded_chunks.update({trunk['id']: dict(id=trunk['id'], created_at=trunk['created_at']) for trunk in result})
         result = self._remote_to_df(result)
@@ -94,24 +103,10 @@ class PandasReader(TimeSeriesStore):
             self._df = pd.concat([self._df, result]).drop_duplicates()
             self._df.sort_index(inplace=True)
         else:
-            self._df = result
+            self._df = result.sort_index()
         return self._df
 
-    def _get_last_trunk_id(self, cur):
-        command = """
-        select id from public.{name}
-        order by id desc 
-        limit 1
-        ;
-        """.format(name=self.name)
-        cur.execute(command)
-        res = cur.fetchall()
-        return res[0][0]
-
     def _perform_limited_pure_load(self, since=None, trunks=2):
-        connection = self._ensure_connection()
-        cur = connection.cursor()
-
         if len(self._loaded_chunks) < trunks:
             # perform full load
             command = """
@@ -128,8 +123,10 @@ class PandasReader(TimeSeriesStore):
             ;
             """.format(name=self.name)
 
-        cur.execute(command)
-        res = cur.fetchall()
+        with self._connection() as connection:
+            cur = connection.cursor()
+            cur.execute(command)
+            res = cur.fetchall()
         prepared_result = [self._row(x) for x in res]
         return prepared_result
 
@@ -137,14 +134,14 @@ class PandasReader(TimeSeriesStore):
 class Cleaner(TimeSeriesStore):
 
     def clean(self):
-        connection = self._ensure_connection()
-        cur = connection.cursor()
         command = """
         select * from public.{name}
         order by id desc ;
         """.format(name=self.name)
-        cur.execute(command)
-        res = cur.fetchall()
+        with self._connection() as connection:
+            cur = connection.cursor()
+            cur.execute(command)
+            res = cur.fetchall()
         prepared_result = [self._row(x) for x in res]
         for trunk in prepared_result:
             new_data = {}
@@ -159,16 +156,16 @@ class Cleaner(TimeSeriesStore):
             self.update_trunk(trunk['id'], new_data)
 
     def update_trunk(self, id, trunk_data):
-        connection = self._ensure_connection()
-        cur = connection.cursor()
         command = """
         UPDATE public.{name} SET data=(%s) WHERE id=(%s)
         """.format(name=self.name)
         data = Json(trunk_data)
-        try:
-            cur.execute(command, (data, id))
-            connection.commit()
-        except BaseException as e:
-            print("[error] Cache flush failed!")
-        finally:
-            cur.close()
\ No newline at end of file
+        with self._connection() as connection:
+            cur = connection.cursor()
+            try:
+                cur.execute(command, (data, id))
+                connection.commit()
+            except BaseException as e:
+                print("[error] Cache flush failed!")
+            finally:
+                cur.close()
\ No newline at end of file
@@ -1,61 +1,164 @@
 import os
+import threading
+from contextlib import contextmanager
 from urllib import parse
-import psycopg2
+from psycopg2 import extensions, pool
 
 from constants.formats import datastore_records
+from persistence.simple_store import memory_table, has_memory_table
 
 parse.uses_netloc.append("postgres")
-url = parse.urlparse(os.environ["DATABASE_URL"])
-
-
-def _reconnect():
-    return psycopg2.connect(
-        database=url.path[1:],
-        user=url.username,
-        password=url.password,
-        host=url.hostname,
-        port=url.port
-    )
-
-
-_GLOBAL_CONNECTION = _reconnect()
+parse.uses_netloc.append("memory")
+POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", 20))
+
+_URL = None
+_POOL = None
+_POOL_LOCK = threading.Lock()
+# Bounds checked out connections, so callers wait for a free one instead of the pool raising
+_SLOTS = threading.BoundedSemaphore(POOL_SIZE)
+# Connection of the outermost connection() block of each thread
+_LOCAL = threading.local()
+
+
+def get_url():
+    """
+    Returns parsed DATABASE_URL. `memory://` selects the in-process stand-in instead of Postgres.
+    :return:
+    """
+    global _URL
+    if _URL is None:
+        url = os.environ.get("DATABASE_URL")
+        if not url:
+            raise RuntimeError("DATABASE_URL is not set, set it to a Postgres URL, or to memory:// for the "
+                               "in-memory database of offline runs and tests")
+        _URL = parse.urlparse(url)
+    return _URL
+
+
+def is_offline():
+    # Stores are created before they connect, an unset DATABASE_URL is reported by the first connection
+    if _URL is None and not os.environ.get("DATABASE_URL"):
+        return False
+    return get_url().scheme == "memory"
+
+
+def _get_pool():
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                url = get_url()
+                _POOL = pool.ThreadedConnectionPool(
+                    0,
+                    POOL_SIZE,
+                    database=url.path[1:],
+                    user=url.username,
+                    password=url.password,
+                    host=url.hostname,
+                    port=url.port
+                )
+    return _POOL
+
+
+def _is_healthy(connection, ping=False):
+    if connection.closed:
+        return False
+    status = connection.get_transaction_status()
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    try:
+        if status == extensions.TRANSACTION_STATUS_INERROR:
+            connection.rollback()
+        if ping:
+            cur = connection.cursor()
+            cur.execute("select 1")
+            cur.close()
+            connection.rollback()
+    except BaseException:
+        return False
+    return True
+
+
+def checkout():
+    """
+    Returns a healthy connection from the process-wide pool, creating the pool and connections on demand.
+    Waits while POOL_SIZE connections are checked out, every checkout must be followed by release().
+    :return:
+    """
+    connection_pool = _get_pool()
+    _SLOTS.acquire()
+    try:
+        for attempt in range(POOL_SIZE + 1):
+            connection = connection_pool.getconn()
+            if _is_healthy(connection, ping=True):
+                return connection
+            connection_pool.putconn(connection, close=True)
+    except BaseException:
+        _SLOTS.release()
+        raise
+    _SLOTS.release()
+    raise pool.PoolError("no healthy connection available")
+
+
+def release(connection):
+    if connection is None or _POOL is None:
+        return
+    try:
+        healthy = _is_healthy(connection)
+        if healthy and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+        _POOL.putconn(connection, close=not healthy)
+    finally:
+        _SLOTS.release()
+
+
+@contextmanager
+def connection():
+    """
+    Checks out a pooled connection for the duration of the block and returns it to the pool afterwards.
+    Nested blocks of a thread share the connection of the outermost one, so they never wait for a second one.
+    :return:
+    """
+    held = getattr(_LOCAL, 'connection', None)
+    if held is not None:
+        yield held
+        return
+    _LOCAL.connection = checkout()
+    try:
+        yield _LOCAL.connection
+    finally:
+        held, _LOCAL.connection = _LOCAL.connection, None
+        release(held)
 
 
 class BaseSQLStore:
     _columns = []
 
     def __init__(self, name, format=None):
-        global _GLOBAL_CONNECTION
         if format is None:
             format = datastore_records
-        self._connection = _GLOBAL_CONNECTION
         self.name = name
         self._table_connected = False
         self._table_format = format
-        self._username = url.username
-
-    def _ensure_connection(self, ensure_table=False):
-        global _GLOBAL_CONNECTION
-        try:
-            self._connection.isolation_level
-        except BaseException:
-            self._connection.close()
-            _GLOBAL_CONNECTION = _reconnect()
-            self._connection = _GLOBAL_CONNECTION
-
-        if ensure_table:
-            if not self._table_connected:
-                self._connect_table()
-
-        return self._connection
+        self._offline = is_offline()
+
+    @contextmanager
+    def _connection(self, ensure_table=False):
+        """
+        Checks out a pooled connection for one operation, see connection()
+        :param ensure_table: connect or create the store table first
+        :return:
+        """
+        if self._offline:
+            raise RuntimeError('{} has no SQL connection, DATABASE_URL selects the in-memory database'.format(
+                self.name))
+        if ensure_table and not self._table_connected:
+            self._connect_table()
+        with connection() as checked_out:
+            yield checked_out
 
     def _connect_table(self, init=True):
-        connection = self._ensure_connection()
-        cur = connection.cursor()
-        cur.execute("select exists(select * from information_schema.tables where table_name=%s)", (self.name,))
-        result = cur.fetchone()[0]
-        cur.close()
-        if result:
+        if self._table_exists(self.name):
             self._table_connected = True
             return True
         else:
@@ -64,19 +167,36 @@ class BaseSQLStore:
             else:
                 return False
 
-    def _init_table(self, name=None, user=None):
-        if user is None:
-            user = self._username
+    def _table_exists(self, name):
+        if self._offline:
+            return has_memory_table(name)
+        with self._connection() as connection:
+            cur = connection.cursor()
+            cur.execute("select exists(select * from information_schema.tables where table_name=%s)", (name,))
+            result = cur.fetchone()[0]
+            cur.close()
+        return result
+
+    def _init_table(self, name=None, user=None, table_format=None, primary_key='id'):
         if name is None:
             name = self.name
+        if self._offline:
+            memory_table(name)
+            if name == self.name:
+                self._table_connected = True
+            return True
+        if user is None:
+            user = get_url().username
+        if table_format is None:
+            table_format = self._table_format
 
-        table_spec = "\n".join(["{} {},".format(k, v) for k, v in self._table_format.items()])
+        table_spec = "\n".join(["{} {},".format(k, v) for k, v in table_format.items()])
 
         command = """
             CREATE TABLE public.{name}
             (
                 {spec}
-                PRIMARY KEY (id)
+                PRIMARY KEY ({primary_key})
             )
             WITH (
                 OIDS = FALSE
@@ -84,13 +204,14 @@ class BaseSQLStore:
 
             ALTER TABLE public.{name}
                 OWNER to {user};
-        """.format(spec=table_spec, name=name, user=user)
+        """.format(spec=table_spec, name=name, user=user, primary_key=primary_key)
 
-        connection = self._ensure_connection()
-        cur = connection.cursor()
-        cur.execute(command)
-        connection.commit()
-        cur.close()
+        with self._connection() as connection:
+            cur = connection.cursor()
+            cur.execute(command)
+            connection.commit()
+            cur.close()
 
-        self._table_connected = True
+        if name == self.name:
+            self._table_connected = True
         return True
@@ -1,3 +1,15 @@
+# Tables of the in-memory database stand-in, shared by all stores of the process
+_MEMORY_TABLES = {}
+
+
+def memory_table(name):
+    return _MEMORY_TABLES.setdefault(name, {})
+
+
+def has_memory_table(name):
+    return name in _MEMORY_TABLES
+
+
 class InMemoryStore:
     def __init__(self, *args, **kwargs):
         super().__init__()
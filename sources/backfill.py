@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import monotonic, sleep, time
+
+import pandas as pd
+
+from constants.formats import candle_format
+
+
+class RateLimiter:
+    """
+    Spaces calls of wait() from any thread at least 1 / rate seconds apart
+    """
+
+    def __init__(self, rate):
+        self._interval = 1.0 / rate
+        self._next = monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = monotonic()
+            scheduled = max(now, self._next)
+            self._next = scheduled + self._interval
+        if scheduled > now:
+            sleep(scheduled - now)
+
+
+class ParquetSink:
+    """
+    Writes every page of candles to its own Parquet file in a directory, requires pyarrow or fastparquet
+    """
+
+    def __init__(self, path):
+        self._path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, data):
+        df = pd.DataFrame.from_records(data, columns=candle_format)
+        first = int(df['timestamp'].min())
+        last = int(df['timestamp'].max())
+        df.to_parquet(os.path.join(self._path, "{}_{}.parquet".format(first, last)))
+
+
+class Backfill:
+    """
+    Fetches a historical range of candles as page-sized windows, several at a time under a request rate limit.
+    Completed pages are cached on disk, so an interrupted or partially failed run resumes where it stopped,
+    and every page is written to the sink as soon as it is available.
+    """
+
+    def __init__(self, source, workers=4, rate=1.0, cache_dir='.backfill'):
+        """
+        :param source: CurrencySource with `currency` and `period` set
+        :param workers: concurrent requests
+        :param rate: requests per second
+        :param cache_dir: directory of completed pages
+        """
+        self._source = source
+        self._workers = workers
+        self._limiter = RateLimiter(rate)
+        self._cache_dir = os.path.join(
+            cache_dir, type(source).__name__.lower(), "{}_{}".format(source.currency, source.period)
+        )
+        self.failed = []
+
+    def run(self, after, before, sink=None):
+        """
+        Backfills candles between two datetimes, failed windows are left in `failed`
+        :param after: datetime
+        :param before: datetime
+        :param sink: object with write(records), e.g. a TimeSeriesStore with candle_format columns or ParquetSink,
+        flushed at the end if it has a flush() method
+        :return: number of candles written
+        """
+        os.makedirs(self._cache_dir, exist_ok=True)
+        self.failed = []
+        written = 0
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            futures = {executor.submit(self._page, window): window for window in self._windows(after, before)}
+            for future in as_completed(futures):
+                try:
+                    candles = future.result()
+                except Exception as e:
+                    print("[error] Page {} - {} failed: {}".format(*futures[future], e))
+                    self.failed.append(futures[future])
+                    continue
+                if candles and sink is not None:
+                    sink.write(candles)
+                written += len(candles)
+        if sink is not None and hasattr(sink, 'flush'):
+            sink.flush()
+        print("[info] Backfilled {} candles, {} pages failed".format(written, len(self.failed)))
+        return written
+
+    def _windows(self, after, before):
+        step = self._source.page_limit * self._source.period_seconds
+        start = int(after.timestamp())
+        end = int(before.timestamp())
+        # Disjoint windows, APIs include both ends
+        return [(x, min(x + step, end) - 1) for x in range(start, end, step)]
+
+    def _page(self, window):
+        filename = os.path.join(self._cache_dir, "{}_{}.json".format(*window))
+        if os.path.exists(filename):
+            with open(filename) as infile:
+                return json.load(infile)
+        self._limiter.wait()
+        candles = self._source.fetch_page(*window)
+        # Windows reaching into the last period are not complete yet
+        if window[1] <= time() - self._source.period_seconds:
+            temporary = filename + '.tmp'
+            with open(temporary, 'w') as outfile:
+                json.dump(candles, outfile)
+            os.replace(temporary, filename)
+        return candles
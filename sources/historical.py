@@ -1,8 +1,9 @@
+from collections import deque
 from types import SimpleNamespace
 from string import Template
 from datetime import timedelta, datetime
 from dateutil import parser
-import requests
+from utils import session
 
 from constants import currencies, periods, remote
 
@@ -10,28 +11,61 @@ from constants import currencies, periods, remote
 class CurrencySource(SimpleNamespace):
     source = Template("")
     source_trades = Template("")
+    # Trades past the $since cursor, None if the API can't filter by it
+    source_new_trades = None
+    cursor_field = 'timestamp'
+    seen_trades_limit = 10000
+    # Candles returned by one historical request
+    page_limit = 1000
     name = ""
     period = ""
     currencies = {}
     periods = {}
 
+    @property
+    def period_seconds(self):
+        return periods.SECONDS[self.period]
+
     def _get_after_time(self, aftertime):
-        return int(parser.parse(aftertime, ignoretz=True).timestamp())
+        return self._to_api_time(parser.parse(aftertime, ignoretz=True).timestamp())
 
     def _get_before_time(self, beforetime):
-        return int((parser.parse(beforetime, ignoretz=True) + timedelta(days=1)).timestamp())
+        return self._to_api_time((parser.parse(beforetime, ignoretz=True) + timedelta(days=1)).timestamp())
+
+    def _to_api_time(self, timestamp):
+        return int(timestamp)
 
     def fetch_historical(self, after="2000-01-01", before="2001-01-01", **kwargs):
         after = self._get_after_time(after)
         before = self._get_before_time(before)
+        return self._request_historical(after, before, **kwargs).json()
+
+    def fetch_page(self, after, before, **kwargs):
+        """
+        Returns candles of one page-sized window as dicts in candle_format
+        :param after: UNIX timestamp
+        :param before: UNIX timestamp
+        :return:
+        """
+        response = self._request_historical(self._to_api_time(after), self._to_api_time(before), **kwargs)
+        response.raise_for_status()
+        return self._parse_candles(response.json())
+
+    def _request_historical(self, after, before, **kwargs):
+        currency = self.currencies[self.currency]
+        if isinstance(currency, dict):
+            currency = currency.get('historical', None)
         endpoint = self.source.substitute(
-            currency=self.currencies[self.currency],
+            currency=currency,
             period=self.periods[self.period],
             after=after,
             before=before,
+            limit=self.page_limit,
             **kwargs)
-        result = requests.get(endpoint)
-        return result.json()
+        return session.get(endpoint)
+
+    def _parse_candles(self, response):
+        return response
 
     def fetch_latest_trades(self, minutes=2, limit=50, raise_error=True, **kwargs):
         after = int((datetime.utcnow() - timedelta(minutes=minutes)).timestamp())
@@ -40,14 +74,59 @@ class CurrencySource(SimpleNamespace):
             after=after,
             limit=limit,
             **kwargs)
+        return self._request_trades(endpoint, **kwargs)
+
+    def fetch_new_trades(self, minutes=2, limit=50, **kwargs):
+        """
+        Returns trades not returned by previous calls. Once a trade was seen, only trades past the latest
+        `cursor_field` value are requested where the API supports it, and trades already seen are dropped.
+        :param minutes: window of the first request
+        :param limit:
+        :return:
+        """
+        cursor = getattr(self, '_cursor', None)
+        if cursor is None or self.source_new_trades is None:
+            trades = self.fetch_latest_trades(minutes=minutes, limit=limit, **kwargs)
+        else:
+            endpoint = self.source_new_trades.substitute(
+                currency=self.currencies[self.currency].get('trade', None),
+                since=cursor,
+                limit=limit,
+                **kwargs)
+            trades = self._request_trades(endpoint, **kwargs)
+        return self._drop_seen(trades)
+
+    def _request_trades(self, endpoint, **kwargs):
         try:
-            result = requests.get(endpoint).json()
+            result = session.get(endpoint).json()
         except BaseException as e:
             print(e)
             result = []
 
         return self._postprocess(result, **kwargs)
 
+    def _drop_seen(self, trades):
+        if getattr(self, '_seen', None) is None:
+            self._seen = set()
+            self._seen_order = deque()
+            self._cursor = None
+        rv = []
+        for trade in trades:
+            key = trade.get('id')
+            if key is None:
+                key = (trade.get('timestamp'), trade.get('price'), trade.get('volume'))
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            self._seen_order.append(key)
+            if len(self._seen_order) > self.seen_trades_limit:
+                self._seen.discard(self._seen_order.popleft())
+            value = trade.get(self.cursor_field)
+            if value is not None and (self._cursor is None or value > self._cursor):
+                self._cursor = value
+            rv.append(trade)
+        return rv
+
     def _postprocess(self, response, **kwargs):
         return response
 
@@ -59,6 +138,9 @@ class CryptowatchSource(CurrencySource):
     source_trades = Template(
         'https://api.cryptowat.ch/markets/gdax/$currency/trades?limit=$limit&since=$after'
     )
+    source_new_trades = Template(
+        'https://api.cryptowat.ch/markets/gdax/$currency/trades?limit=$limit&since=$since'
+    )
 
     currencies = {
         currencies.BTC: dict(historical="btc", trade="btcusd"),
@@ -71,11 +153,15 @@ class CryptowatchSource(CurrencySource):
         periods.P30M: 30 * 60
     }
 
+    def _parse_candles(self, response):
+        rows = response.get('result', {}).get(str(self.periods[self.period])) or []
+        return [dict(timestamp=x[0], open=x[1], high=x[2], low=x[3], close=x[4], volume=x[5]) for x in rows]
+
     def _postprocess(self, response, **kwargs):
         try:
             res = response.get('result', [])
             print(int(response.get('allowance', dict(remaining=0))['remaining']/1000))
-            res = [dict(timestamp=x[1], price=x[2], volume=x[3]) for x in res]
+            res = [dict(id=x[0] or None, timestamp=x[1], price=x[2], volume=x[3]) for x in res]
         except BaseException as e:
             res = []
         return res
@@ -85,18 +171,28 @@ class KunaIoSource(CurrencySource):
     source_trades = Template(
         'https://kuna.io/api/v2/trades?market=$currency'
     )
+    source_new_trades = Template(
+        'https://kuna.io/api/v2/trades?market=$currency&from=$since&limit=$limit'
+    )
+    cursor_field = 'id'
+    source_order_book = Template(
+        'https://kuna.io/api/v2/order_book?market=$currency'
+    )
 
     currencies = {
         currencies.BTC: dict(historical="", trade="btcuah")
     }
+    fx_rates = remote.UAH_RATES
 
     def fetch_historical(self, **kwargs):
         raise NotImplementedError('No historical data for kuna.io!')
 
     def fetch_order_book(self, **kwargs):
-        endpoint = "https://kuna.io/api/v2/order_book?market=btcuah"
+        endpoint = self.source_order_book.substitute(
+            currency=self.currencies[self.currency].get('trade', None),
+            **kwargs)
         try:
-            result = requests.get(endpoint).json()
+            result = session.get(endpoint).json()
         except BaseException as e:
             print(e)
             result = {"asks": [], "bids": []}
@@ -104,7 +200,7 @@ class KunaIoSource(CurrencySource):
 
     def _postprocess(self, response, convert_to=None):
         if convert_to is not None:
-            conversion_rate = float(remote.get_UAH_rate(convert_to))
+            conversion_rate = float(self.fx_rates.get(convert_to))
         else:
             conversion_rate = 1
 
@@ -119,7 +215,7 @@ class KunaIoSource(CurrencySource):
 
 class BitfinexSource(CurrencySource):
     source = Template(
-        'https://api.bitfinex.com/v2/candles/trade:$period:t$currency/hist?start=$after&end=$before'
+        'https://api.bitfinex.com/v2/candles/trade:$period:t$currency/hist?start=$after&end=$before&limit=$limit'
     )
 
     currencies = {
@@ -133,9 +229,9 @@ class BitfinexSource(CurrencySource):
         periods.P30M: "30m"
     }
 
-    def _get_after_time(self, aftertime):
-        return int(parser.parse(aftertime, ignoretz=True).timestamp()) * 1000
+    def _to_api_time(self, timestamp):
+        return int(timestamp) * 1000
 
-    def _get_before_time(self, beforetime):
-        return int((parser.parse(beforetime, ignoretz=True) + timedelta(days=1)).timestamp()) * 1000
+    def _parse_candles(self, response):
+        return [dict(timestamp=x[0] / 1000, open=x[1], close=x[2], high=x[3], low=x[4], volume=x[5]) for x in response]
 
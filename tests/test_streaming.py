@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from algorithms.arbitragealgorithm import ArbitrageAlgorithm
+from constants.formats import signal_format
+from models.arbitrageplotter import to_milliseconds
+from models.trader import LiveTrader
+
+NOW = datetime(2018, 8, 11, 10, tzinfo=timezone.utc)
+
+
+class MinuteAlgorithm(ArbitrageAlgorithm):
+    step = '1min'
+
+
+def make_frames(start, minutes, every=10.0):
+    timestamps = start.timestamp() + np.arange(0, minutes * 60, every)
+    index = pd.to_datetime(timestamps, unit='s')
+    source = pd.DataFrame({'timestamp': timestamps, 'price': 10000 + np.sin(timestamps / 300) * 50}, index=index)
+    spread = np.cos(timestamps / 200) * 900 + np.sin(timestamps / 70) * 1500
+    orderbook = pd.DataFrame({'timestamp': timestamps, 'ask': 270500 + spread, 'bid': 269500 + spread}, index=index)
+    return source, orderbook
+
+
+def test_no_data_and_stream_signals_can_be_plotted():
+    trader = LiveTrader(name="test_trades", columns=signal_format, time_unit="s", time_field="timestamp")
+    algorithm = MinuteAlgorithm()
+    trader.add_algorithm(algorithm)
+    source, orderbook = make_frames(NOW - timedelta(minutes=60), 60)
+    # Too few order book rows first, then enough for the stream
+    for rows in (2, len(orderbook)):
+        signal = algorithm.signal(source.iloc[:rows], orderbook.iloc[:rows], current_datetime=NOW)
+        record = signal._asdict()
+        record['result'] = signal.decision
+        record['logged_time'] = NOW
+        trader.signal_history.append(record)
+    chart = trader.signal_history.to_frame(signal_format)
+    chart['Time'] = chart['buy_datetime']
+    chart.set_index('Time', inplace=True)
+    milliseconds = to_milliseconds(chart.index)
+    assert not np.isnan(milliseconds).any()
+    assert milliseconds[1] == (NOW - timedelta(minutes=1)).timestamp() * 1000
+
+
+
+def test_stream_signal_matches_batch():
+    streamed = MinuteAlgorithm()
+    start = NOW - timedelta(minutes=180)
+    source, orderbook = make_frames(start, 180)
+
+    def preprocessor(source_df, order_book):
+        return (source_df.resample(streamed.step).mean().interpolate(),
+                order_book.resample(streamed.step).mean().interpolate())
+
+    for minute in range(30, 181, 7):
+        current_time = start + timedelta(minutes=minute)
+        cutoff = current_time.timestamp() - streamed.cutaway.total_seconds()
+        visible = source['timestamp'] < current_time.timestamp()
+        window = visible & (source['timestamp'] >= cutoff)
+        stream_signal = streamed.signal(source[visible], orderbook[visible], current_datetime=current_time)
+        batch_algorithm = MinuteAlgorithm()
+        batch_signal = batch_algorithm.signal(
+            source[window], orderbook[window], preprocessor=preprocessor, current_datetime=current_time
+        )
+        assert stream_signal.buy == batch_signal.buy
+        assert stream_signal.sell == batch_signal.sell
+        assert stream_signal.decision == batch_signal.decision
+        assert stream_signal.buy_datetime == pd.Timestamp(batch_signal.buy_datetime).tz_localize('UTC')
+        batch_series = batch_algorithm.latest_dataframe
+        stream_series = streamed.latest_dataframe
+        assert list(stream_series.index) == list(batch_series.index.tz_localize('UTC'))
+        assert np.allclose(stream_series.values, batch_series.values)
@@ -0,0 +1,48 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+# (connect, read) seconds
+TIMEOUT = (3.05, 10)
+RETRIES = 3
+BACKOFF_FACTOR = 0.3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+POOL_SIZE = 10
+
+_LOCAL = threading.local()
+
+
+def get_session():
+    """
+    Returns a requests Session of the calling thread, reusing keep-alive connections across requests.
+    Idempotent requests are retried with exponential backoff on connection errors and retryable statuses,
+    POST requests are never retried.
+    :return:
+    """
+    session = getattr(_LOCAL, 'session', None)
+    if session is None:
+        session = requests.Session()
+        retry = Retry(
+            total=RETRIES,
+            backoff_factor=BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Accept-Encoding'] = 'gzip, deflate'
+        _LOCAL.session = session
+    return session
+
+
+def get(url, **kwargs):
+    kwargs.setdefault('timeout', TIMEOUT)
+    return get_session().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    kwargs.setdefault('timeout', TIMEOUT)
+    return get_session().post(url, **kwargs)